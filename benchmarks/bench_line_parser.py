@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of log line parsers: LINE_FORMAT regex vs fast extractor compiled from LOG_FORMAT.
+
+Usage:  bench_line_parser.py [options]
+
+Options:
+    -l LOG_FILE --log=LOG_FILE      Plain log file to parse [default: tests/logs/log20200101]
+    -r REPEAT --repeat=REPEAT       Number of passes over log lines [default: 20]
+    -h  --help                      Show this screen.
+"""
+
+import sys
+import re
+import time
+from pathlib import Path
+from docopt import docopt
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import log_analyzer as la   # noqa: E402
+
+
+def bench(parse, lines, repeat: int) -> float:
+    """Return lines per second rate of [parse] function over [lines] parsed [repeat] times."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            parse(line)
+    return len(lines) * repeat / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    log_cfg = la.App.cfg.Logs
+    with open(args["--log"], 'rb') as log:
+        lines = [line.rstrip(b"\r\n") for line in log]
+    regex = re.compile(log_cfg.LINE_FORMAT, re.IGNORECASE)
+    line_parser = la.LineParser(log_cfg.LINE_FORMAT, log_cfg.LOG_FORMAT)
+    fast_count = sum(1 for line in lines if line_parser.fast_request_info(line))
+    regex_rate = bench(lambda line: la.get_request_info(line.decode(la.App.ENCONDING), regex), lines, int(args["--repeat"]))
+    fast_rate = bench(line_parser, lines, int(args["--repeat"]))
+    print(f'lines: {len(lines)}, parsed by fast extractor: {fast_count}')
+    print(f'regex:          {regex_rate:12,.0f} lines/sec')
+    print(f'fast extractor: {fast_rate:12,.0f} lines/sec (x{fast_rate / regex_rate:.2f})')
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of log_analyzer main() on synthetic logs (see gen_log.py): lines/sec, wall time per stage and peak RSS.
+
+Every scenario (log format x workers x statistics engine) is run in a separate process, results are saved as JSON
+(by default to benchmarks/results/<commit>.json), so they can be compared with results of another commit to catch regressions.
+
+Usage:  bench_main.py [options]
+        bench_main.py run <config_ini>
+
+Options:
+    -s SIZE --size=SIZE             Size of uncompressed log: bytes or with K, M, G suffix [default: 64M]
+    -u URLS --urls=URLS             Number of distinct urls [default: 10000]
+    -t DIST --time-dist=DIST        Distribution of $request_time: lognormal, exponential, pareto, uniform [default: lognormal]
+    -m RATIO --malformed=RATIO      Share of malformed lines [default: 0.001]
+    --seed=SEED                     Random seed of log generator [default: 1]
+    -f FORMATS --formats=FORMATS    Comma separated log formats: plain, gz, bz2, xz [default: plain,gz]
+    -j WORKERS --workers=WORKERS    Comma separated values of Logs.WORKERS [default: 1]
+    -e ENGINES --engines=ENGINES    Comma separated values of Stats.ENGINE [default: stream]
+    --decompressor=DECOMPRESSOR     Value of Logs.DECOMPRESSOR: internal (module) or external (tool) [default: internal]
+    -r REPEAT --repeat=REPEAT       Number of runs of every scenario, the fastest one is taken [default: 1]
+    -d DIR --data-dir=DIR           Directory of generated logs (reused by next runs with the same parameters) [default: benchmarks/data]
+    -o RESULTS --output=RESULTS     Results file [default: benchmarks/results/{commit}.json]
+    --compare=BASELINE              Compare results with BASELINE results file, exit code is 1 if some scenario is regressed.
+    --tolerance=TOLERANCE           Allowed relative degradation of lines/sec and peak RSS [default: 0.1]
+    -h  --help                      Show this screen.
+
+Command run executes main() with <config_ini> in current process and prints its measurements as JSON (used by benchmark itself).
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+import tempfile
+from contextlib import suppress
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import log_analyzer as la   # noqa: E402
+from gen_log import generate_log, parse_size   # noqa: E402
+
+RESULTS_VERSION = 1
+LOG_DATE = '20170630'
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def peak_rss() -> int:
+    """Return peak RSS (in KB) of current process: VmHWM of /proc/self/status if available (ru_maxrss isn't reset by exec, so it can be the one of forked parent)."""
+    with suppress(OSError):
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(config_path: str) -> dict:
+    """Run main() with config [config_path] and return its wall and cpu time, wall time of stages (see App.metrics), return code and peak RSS (in KB)."""
+    la.App.init(config_path)
+    start, cpu_start = time.perf_counter(), time.process_time()
+    code = la.main(la.App)
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {'code': code, 'wall': wall, 'cpu': cpu + children.ru_utime + children.ru_stime, 'stages': dict((name, stage.wall) for name, stage in la.App.metrics.stages.items()),
+            'peak_rss_kb': peak_rss(), 'peak_rss_workers_kb': children.ru_maxrss}
+
+
+def prepare_log(data_dir: Path, log_format: str, size: int, urls: int, time_dist: str, malformed: float, seed: int) -> dict:
+    """Return parameters of generated log (made if it doesn't exist in [data_dir] yet)."""
+    log_dir = data_dir / f'{size}-{urls}-{time_dist}-{malformed}-{seed}-{log_format}'
+    params_path = log_dir / 'params.json'
+    if params_path.exists():
+        return json.loads(params_path.read_text())
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_path = log_dir / f'nginx-access-ui.log-{LOG_DATE}{"" if log_format == "plain" else "." + log_format}'
+    print(f'Generating log {log_path} ...', flush=True)
+    params = generate_log(log_path, size, urls, time_dist=time_dist, malformed=malformed, date=LOG_DATE, seed=seed)
+    params['format'] = log_format
+    params_path.write_text(json.dumps(params))
+    return params
+
+
+def run_scenario(log_params: dict, workers: str, engine: str, decompressor: str, repeat: int) -> dict:
+    """Run main() on log [log_params] with Logs.WORKERS=[workers], Stats.ENGINE=[engine], Logs.DECOMPRESSOR=[decompressor] in a separate process [repeat] times, return the fastest run."""
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = Path(tmp_dir, 'bench.ini')
+            la.App.save_config(str(config_path), {
+                'Report': {'DIR': str(Path(tmp_dir, 'reports')), 'TEMPLATE_FILE_PATH': str(REPO_DIR / 'reports' / 'report.html')},
+                'Logs': {'DIR': str(Path(log_params['log']).parent), 'UNMATCHED_LINE_LIMIT': '', 'WORKERS': workers, 'DECOMPRESSOR': '' if decompressor == 'internal' else decompressor},
+                'Logging': {'FILE_CFG': '', 'BASE_CONFIG_LEVEL': 'WARNING'},
+                'Stats': {'ENGINE': engine},
+                })
+            process = subprocess.run([sys.executable, __file__, 'run', str(config_path)], stdout=subprocess.PIPE, check=True, text=True)
+            runs.append(json.loads(process.stdout.splitlines()[-1]))
+    result = min(runs, key=lambda run_result: run_result['wall'])
+    result['lines_per_sec'] = log_params['lines'] / result['wall']
+    result['bytes_per_sec'] = log_params['size'] / result['wall']
+    return result
+
+
+def git_commit() -> tuple:
+    """Return (short hash of HEAD commit, true if work tree has changes) of repository, or (None, None) if git isn't available."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, text=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR, stdout=subprocess.PIPE, check=True, text=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def scenario_key(scenario: dict) -> str:
+    """Return key of scenario to match results of different runs."""
+    return json.dumps(scenario, sort_keys=True)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Print comparison of [results] with [baseline] results and return descriptions of regressions (worse than [tolerance])."""
+    baseline_results = dict((scenario_key(result['scenario']), result) for result in baseline['results'])
+    regressions = []
+    print(f'\nComparison with {baseline.get("commit")} ({baseline.get("timestamp")}):')
+    for result in results['results']:
+        if (base := baseline_results.get(scenario_key(result['scenario']))) is None:
+            continue
+        speed, rss = result['lines_per_sec'] / base['lines_per_sec'], result['peak_rss_kb'] / base['peak_rss_kb']
+        name = format_scenario(result['scenario'])
+        print(f'{name:40} lines/sec x{speed:.3f}, peak RSS x{rss:.3f}')
+        if speed < 1 - tolerance:
+            regressions.append(f'{name}: lines/sec x{speed:.3f}')
+        if rss > 1 + tolerance:
+            regressions.append(f'{name}: peak RSS x{rss:.3f}')
+    return regressions
+
+
+def format_scenario(scenario: dict) -> str:
+    """Return short description of [scenario]."""
+    return f'{scenario["format"]}, workers={scenario["workers"]}, {scenario["engine"]}, {scenario.get("decompressor", "internal")}'
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+    args = docopt(__doc__)
+    if args["run"]:
+        print(json.dumps(run(args["<config_ini>"])))
+        sys.exit(0)
+    commit, dirty = git_commit()
+    results = {'version': RESULTS_VERSION, 'commit': commit, 'dirty': dirty, 'timestamp': datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'results': []}
+    size, urls, time_dist, malformed, seed = parse_size(args["--size"]), int(args["--urls"]), args["--time-dist"], float(args["--malformed"]), int(args["--seed"])
+    for log_format, workers, engine in product(args["--formats"].split(','), args["--workers"].split(','), args["--engines"].split(',')):
+        log_params = prepare_log(Path(args["--data-dir"]), log_format.strip(), size, urls, time_dist, malformed, seed)
+        scenario = {'format': log_params['format'], 'size': log_params['size'], 'lines': log_params['lines'], 'urls': urls, 'time_dist': time_dist,
+                    'malformed': malformed, 'seed': seed, 'workers': workers.strip(), 'engine': engine.strip(), 'decompressor': args["--decompressor"]}
+        result = run_scenario(log_params, scenario['workers'], scenario['engine'], scenario['decompressor'], int(args["--repeat"]))
+        results['results'].append({'scenario': scenario, **result})
+        stages = ', '.join(f'{stage} {wall:.2f}s' for stage, wall in result['stages'].items())
+        print(f'{format_scenario(scenario):40} {result["lines_per_sec"]:12,.0f} lines/sec, {result["bytes_per_sec"] / (1 << 20):8.1f} MB/sec, wall {result["wall"]:.2f}s '
+              f'({stages}), peak RSS {result["peak_rss_kb"] / 1024:.0f} MB (workers {result["peak_rss_workers_kb"] / 1024:.0f} MB)', flush=True)
+    output_path = Path(args["--output"].format(commit=f'{commit}{"-dirty" if dirty else ""}' if commit else datetime.now().strftime('%Y%m%d%H%M%S')))
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(results, indent=2))
+    print(f'Results have been saved to {output_path}')
+    if args["--compare"]:
+        regressions = compare(results, json.loads(Path(args["--compare"]).read_text()), float(args["--tolerance"]))
+        if regressions:
+            print('Regressions:\n' + '\n'.join(regressions))
+            sys.exit(1)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Seeded generator of synthetic nginx logs in the shape of default Logs.LOG_FORMAT (matched by default Logs.LINE_FORMAT).
+
+The same arguments (and seed) always give the same log, so benchmark results of different commits are comparable.
+
+Usage:  gen_log.py [options] <log_file>
+
+Options:
+    -s SIZE --size=SIZE             Size of uncompressed log: bytes or with K, M, G suffix [default: 64M]
+    -u URLS --urls=URLS             Number of distinct urls [default: 10000]
+    --url-skew=SKEW                 Zipf exponent of url popularity, 0 - uniform [default: 1.1]
+    -t DIST --time-dist=DIST        Distribution of $request_time: lognormal, exponential, pareto, uniform [default: lognormal]
+    --time-scale=SCALE              Median of $request_time (in seconds) [default: 0.1]
+    -m RATIO --malformed=RATIO      Share of malformed lines [default: 0.001]
+    --date=DATE                     Date of log records in %Y%m%d format [default: 20170630]
+    --seed=SEED                     Random seed [default: 1]
+    -h  --help                      Show this screen.
+
+Log is compressed by extension of <log_file>: .gz, .bz2, .xz or plain otherwise.
+"""
+
+import bz2
+import gzip
+import lzma
+import math
+import random
+from bisect import bisect
+from datetime import datetime
+from itertools import accumulate
+from pathlib import Path
+
+SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+METHODS = ('GET', 'GET', 'GET', 'GET', 'POST', 'POST', 'PUT', 'DELETE', 'HEAD', 'OPTIONS')
+STATUSES = ('200',) * 90 + ('204', '301', '302', '304', '400', '403', '404', '404', '499', '500', '502', '503')
+USER_AGENTS = ('Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5', 'Python-urllib/2.7', 'Slotovod', '-',
+               'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36')
+URL_TEMPLATES = ('/api/v2/banner/{id}', '/api/v2/group/{id}/statistic/sites/?date_type=day&date_from=2017-06-28&date_to=2017-06-28',
+                 '/api/1/photogenic_banners/list/?server_name=WIN7RB{id}', '/api/v2/slot/{id}/groups', '/export/appinstall_raw/2017-06-{id}/',
+                 '/accounts/login/?next=/{id}/', '/api/v2/internal/html5/phantomjs/queue/?wait={id}', '/agency/outstanding_payments_summary/{id}/')
+TIME_DISTRIBUTIONS = {
+    'lognormal': lambda rnd, scale: rnd.lognormvariate(math.log(scale), 1),
+    'exponential': lambda rnd, scale: rnd.expovariate(math.log(2) / scale),
+    'pareto': lambda rnd, scale: scale / 2 ** (1 / 1.5) * rnd.paretovariate(1.5),
+    'uniform': lambda rnd, scale: rnd.uniform(0, 2 * scale),
+}
+
+
+def parse_size(size: str) -> int:
+    """
+    Return number of bytes of [size] with optional K, M, G suffix.
+
+    >>> parse_size('64M'), parse_size('1000')
+    (67108864, 1000)
+    """
+    size = size.strip().upper().rstrip('B')
+    return int(float(size.rstrip('KMG') or 0) * SIZE_UNITS[size[-1] if size[-1:] in SIZE_UNITS else ''])
+
+
+def open_log(log_path: Path):
+    """Open [log_path] for binary writing, compressed by its extension (.gz, .bz2, .xz)."""
+    return {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}.get(log_path.suffix, open)(log_path, 'wb')
+
+
+def generate_log(log_path: Path, size: int, urls: int = 10000, url_skew: float = 1.1, time_dist: str = 'lognormal', time_scale: float = 0.1,
+                 malformed: float = 0.001, date: str = '20170630', seed: int = 1) -> dict:
+    """
+    Write synthetic log of [size] uncompressed bytes to [log_path] and return its parameters with number of lines (total and malformed).
+
+    Popularity of [urls] distinct urls follows Zipf law with [url_skew] exponent, $request_time follows [time_dist] with [time_scale] median,
+    records are evenly spread over the day [date] in order of time.
+    """
+    rnd = random.Random(seed)
+    get_time = TIME_DISTRIBUTIONS[time_dist]
+    url_list = [URL_TEMPLATES[i % len(URL_TEMPLATES)].format(id=rnd.randrange(10 ** 8)) for i in range(urls)]
+    cum_weights = list(accumulate(1 / (rank ** url_skew) for rank in range(1, urls + 1)))
+    day_start = datetime.strptime(date, '%Y%m%d').timestamp()
+    # average line is ~220 bytes, so records are spread over the day by this estimation
+    time_step = 86400 / max(size / 220, 1)
+    written, line_count, malformed_count, batch = 0, 0, 0, []
+    with open_log(log_path) as log:
+        while written < size:
+            moment = datetime.fromtimestamp(day_start + min(line_count * time_step, 86399))
+            url = url_list[bisect(cum_weights, rnd.random() * cum_weights[-1])]
+            line = (f'{rnd.randrange(1, 256)}.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(256)} {rnd.choice(("-", "3b81f63526fa8"))}  - '
+                    f'[{moment.strftime("%d/%b/%Y:%H:%M:%S")} +0300] "{rnd.choice(METHODS)} {url} HTTP/1.1" {rnd.choice(STATUSES)} {rnd.randrange(20000)} "-" '
+                    f'"{rnd.choice(USER_AGENTS)}" "-" "{int(day_start)}-{rnd.randrange(1 << 32)}-4708-{line_count}" "-" {get_time(rnd, time_scale):.3f}\n')
+            if malformed and rnd.random() < malformed:
+                # broken record: truncated before request, garbage or empty line
+                line = rnd.choice((line[:line.index('"')] + '\n', f'{rnd.getrandbits(128):x} garbage\n', '\n'))
+                malformed_count += 1
+            line = line.encode()
+            batch.append(line)
+            written += len(line)
+            line_count += 1
+            if len(batch) >= 10000:
+                log.write(b''.join(batch))
+                batch.clear()
+        log.write(b''.join(batch))
+    return {'log': str(log_path), 'size': written, 'lines': line_count, 'malformed_lines': malformed_count, 'urls': urls, 'url_skew': url_skew,
+            'time_dist': time_dist, 'time_scale': time_scale, 'malformed': malformed, 'date': date, 'seed': seed}
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+    args = docopt(__doc__)
+    params = generate_log(Path(args["<log_file>"]), parse_size(args["--size"]), int(args["--urls"]), float(args["--url-skew"]), args["--time-dist"],
+                          float(args["--time-scale"]), float(args["--malformed"]), args["--date"], int(args["--seed"]))
+    print(f'{params["log"]}: {params["size"]:,} bytes, {params["lines"]:,} lines ({params["malformed_lines"]:,} malformed)')
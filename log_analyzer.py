@@ -5,37 +5,73 @@
 LogAnalyzer: python script analyzes nginx's log files.
 
 Usage:  log_analyzer.py [options]
+        log_analyzer.py merge [options] <partial>...
+        log_analyzer.py watch [options]
+        log_analyzer.py rollup [options] <date_from> [<date_to>]
 
 Options:
     -c FILE_INI --config=FILE_INI   Config file [default: log_analyzer.ini]
     -i                              Write default ini config settings to FILE_INI
+    -j WORKERS --workers=WORKERS    Number of parser processes (overrides Logs.WORKERS): 1 - serial, 0 - all cores.
+    --incremental                   Continue parsing of log from checkpoint of previous run and regenerate report (overrides Logs.INCREMENTAL).
+    -b --backfill                   Make reports for every log in Logs.DIR which has no report yet.
+    -p --partial                    Save statistics of log to binary partial file instead of report (overrides Report.PARTIAL).
+    -o REPORT --output=REPORT       Report file made by merge or rollup command (default: in Report.DIR by date of partials or dates of range).
+    --interval=SECONDS              Seconds between polls of Logs.DIR by watch command (overrides Watch.INTERVAL).
+    --port=PORT                     HTTP port of watch command serving report and metrics (overrides Watch.PORT).
     -h  --help                      Show this screen.
     --version                       Show version.
+    --profile                       Profile processing of log by cProfile and tracemalloc, results are saved next to report (overrides Metrics.PROFILE).
     -v                              Run doc tests.
+
+Command rollup makes report of logs from <date_from> to <date_to> (up to the latest log by default), dates are in Logs.FILE_NAME_DATE_FORMAT.
 """
 
 __version__ = 'v0.1.0'
 
 import logging
-import logging.config
 import os
 import sys
 import re
 import copy
 import gzip
 import bz2
+import lzma
+import mmap
+import shutil
+import subprocess
+import math
+import socket
+import struct
+import zlib
+import base64
+import hashlib
+import heapq
+from array import array
 from datetime import datetime
+from functools import partial, lru_cache
 from pathlib import Path
 import collections as cs
-from docopt import docopt, DocoptExit                     # https://pypi.org/project/docopt/
 from configparser import ConfigParser, RawConfigParser    # https://docs.python.org/3/library/configparser.html
 from string import Template
 import json
-from contextlib import suppress
-from operator import itemgetter
-from statistics import median
-import unittest
-import pycodestyle
+import csv
+import io
+import time
+from contextlib import suppress, contextmanager, nullcontext
+from itertools import islice
+from statistics import NormalDist
+from operator import itemgetter, attrgetter
+# heavy modules are imported on demand: numpy (see numpy_module), concurrent.futures (parallel parsing), asyncio (watch mode),
+# logging.config and yaml (Logging.FILE_CFG), docopt (command line)
+try:
+    import zstandard  # optional, in-process decompression of .zst logs (else zstd tool is used)
+except ImportError:
+    zstandard = None
+try:
+    import resource  # unix only, cpu time of worker processes in Metrics
+except ImportError:
+    resource = None
 
 
 class classproperty(property):
@@ -62,6 +98,8 @@ class App:
     REQUIRED_PYTHON_VER = (3, 9)
     ENCONDING = "utf-8"
     ROUND_NDIGITS = 4
+    WRITE_ROWS = 1000  # number of report rows written by one chunk
+    READ_SIZE = 128 * 1024  # size of binary chunks read from log files (bigger ones are slower to split into lines due to cpu cache misses)
 
     __default_config = {
         'App': {
@@ -73,7 +111,11 @@ class App:
             'FILE_NAME_DATE_FORMAT': '%Y%m%d',
             'FILE_NAME_EXT': None,  # if None, then report extension is the same as for template.
             'REPORT_SIZE': '1000',  # Мaximum number of urls in report output sorted by total time (desc). if None, then all.
-            'TEMPLATE_FILE_PATH': 'reports/report.html'  # Path to template file
+            'TEMPLATE_FILE_PATH': 'reports/report.html',  # Path to template file
+            'FORMATS': 'template',  # comma separated formats of report: template (TEMPLATE_FILE_PATH, html), csv, jsonl. the first one names report file, the others are saved next to it.
+            'COMPRESS': None,  # if yes, then report files are gzip compressed (.gz ext is added).
+            'PARTIAL': None,  # if yes, then statistics of log are saved to binary partial file (report file name with .<host>.partial ext) instead of report, see merge command.
+            'CACHE': None,  # if yes, then statistics of every parsed log are also cached to Report.DIR/cache (per day partial file), so rollup command doesn't parse it again.
         },
         'Logs': {
             'DIR':   'logs',  # log files dir
@@ -82,7 +124,22 @@ class App:
             'LINE_FORMAT': r'^(?P<remote_addr>\d{1,3}.\d{1,3}.\d{1,3}.\d{1,3})\s+\S+\s+\S+\s+\[(?P<time_local>.+)\]\s+"'
                            r'(?P<request_method>[A-Z]+)\s+(?P<request_url>[\w\.\-\/]+)(?P<request_params>\?[\S]*)*\s+(?P<protocol>.*?)"\s+(?P<status>\d{3})\s+'
                            r'(?P<body_bytes_sent>\d+)\s+\S+\s+"(?P<http_user_agent>.*?)".*?(?P<request_time>[\d\.]*)$',  # reg expression that should identify <request_url> and <request_time> fields in log. the rest is not used (yet)...
-            'UNMATCHED_LINE_LIMIT': '0.1'  # allowed number of errors for log parsing (in percent). if there are more, then exit with error.
+            'LOG_FORMAT': '$remote_addr $remote_user  $http_x_real_ip [$time_local] "$request" $status $body_bytes_sent "$http_referer" "$http_user_agent" '
+                          '"$http_x_forwarded_for" "$http_X_REQUEST_ID" "$http_X_RB_USER" $request_time',  # nginx log_format of lines which LINE_FORMAT matches (compiled to fast line parser).
+                                                                                                           # LINE_FORMAT is used for lines it can"t handle. if None, then LINE_FORMAT only.
+                                                                                                           # with custom LINE_FORMAT it's used only if it's set in config too.
+            'UNMATCHED_LINE_LIMIT': '0.1',  # allowed number of errors for log parsing (in percent). if there are more, then exit with error.
+            'ABORT_CONFIDENCE': '0.9999',  # log is rejected if share of mismatched sampled lines exceeds UNMATCHED_LINE_LIMIT with this confidence, parsing of plain log is aborted as soon as
+                                           # mismatched lines exceed UNMATCHED_LINE_LIMIT of all lines of log. if None, then limit is checked after parsing only.
+            'VALIDATION_SAMPLE_SIZE': '200',  # number of lines spread across log (the first ones of compressed log) checked before parsing with ABORT_CONFIDENCE. if None or 0, then no check.
+            'MISMATCH_SAMPLES': '10',  # max number of distinct mismatched lines kept as examples for logging.
+            'WORKERS': '1',  # number of parser processes: 1 - serial parsing, 0 - all available cores.
+            'CHUNK_SIZE': '67108864',  # size (in bytes) of line-aligned log ranges (segments for compressed logs) parsed by one worker task.
+            'INCREMENTAL': None,  # if yes, then parsing of log continues from checkpoint (byte offset and statistics) saved by previous run and report is regenerated.
+            'CHECKPOINT_INTERVAL': '268435456',  # size (in bytes) of plain log parsed between checkpoints in incremental mode.
+            'BACKFILL_WORKERS': '0',  # number of processes which make missing reports in backfill mode and missing cached statistics in rollup mode (every log is parsed serially): 0 - all available cores.
+            'DECOMPRESSOR': None,  # None - compressed logs (gz, bz2, xz, zst) are decompressed in process (zst by zstd tool if zstandard isn't installed),
+                                   # 'external' - by external tool (pigz, lbzip2, xz, zstd ... if found) in separate process, so decompression runs on another core.
         },
         'Logging': {
             'LOGGER_NAME': '__name__',  # app logger = logging.getLogger('LOGGER_NAME')
@@ -92,11 +149,38 @@ class App:
             'BASE_CONFIG_FILENAME': None,   # 'log_analyzer.log',
             'BASE_CONFIG_FILEMODE': None,   # 'w'|'a'
             'FILE_CFG': 'logging.ini',      # higher priority over BASE_CONFIG settings
+        },
+        'Stats': {
+            'ENGINE': 'stream',  # 'stream' - bounded-memory statistics by urls, 'columnar' - arrays of all request times processed with NumPy (if installed) at the end.
+            'QUANTILE_RELATIVE_ERROR': '0.01',  # relative error of quantiles (time_med, percentiles) of urls with more than QUANTILE_EXACT_LIMIT requests.
+            'QUANTILE_EXACT_LIMIT': '128',  # max number of request times kept per url to calculate exact quantiles.
+            'PERCENTILES': None,  # comma separated percentiles added to report as time_p<N> columns, e.g. '90, 95, 99'.
+            'DIMENSIONS': None,  # comma separated dimensions of additional report tables calculated in the same pass: status, status_class (5xx), method,
+                                 # time buckets of $time_local: <N>m or <N>h (e.g. 1m, 15m, 1h), minute, hour. e.g. 'status, method, 1h'.
+        },
+        'Urls': {
+            'NORMALIZE': None,  # if yes, then variable segments of urls (ids, hashes, uuids) are collapsed to templates by RULES, e.g. /api/v2/banner/{id}.
+            'RULES': '(?<=/)[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?=/|$) => {uuid}\n'
+                     '(?<=/)\\d+(?=/|$) => {id}\n'
+                     '(?<=/)(?=[a-z]*\\d)[0-9a-f]{8,}(?=/|$) => {hex}',  # lines of url templating rules: <regex> => <replacement>, applied in order to lowercase url.
+            'MAX_KEYS': None,  # if set, then statistics are kept for MAX_KEYS..2*MAX_KEYS urls with max total time only (space-saving), others are evicted. stream engine only, not less than Report.REPORT_SIZE.
+        },
+        'Metrics': {
+            'FILE': None,  # if set, then metrics of log processing (wall/cpu time and items per stage, lines/sec, bytes/sec, mismatch rate) are saved to this file: Prometheus textfile (.prom ext) or JSON.
+            'DETAILED': None,  # if yes, then time of reading (decompression), line matching, url normalization and statistics update is measured per line in serial parsing (with some overhead).
+            'PROFILE': None,  # if yes, then processing of log is profiled by cProfile and tracemalloc, results are saved next to report (.prof and .prof.txt ext).
+        },
+        'Watch': {
+            'INTERVAL': '10',  # seconds between polls of Logs.DIR by watch command (new lines of the latest log are parsed and its report is updated).
+            'HOST': '127.0.0.1',  # address of HTTP endpoint of watch command.
+            'PORT': None,  # if set, then watch command serves report (/, /report.<format>) and metrics (/metrics, /metrics.json) by HTTP on HOST:PORT.
         }
     }
     __config = __default_config
+    __cfg = None
     __logger_name = __name__
     __logger = None
+    __metrics = None
 
     @classproperty
     def logger(cls):
@@ -105,10 +189,31 @@ class App:
             cls.__logger = logging.getLogger(cls.__logger_name)
         return cls.__logger
 
+    @classproperty
+    def metrics(cls) -> 'Metrics':
+        """Return Metrics of current run (new one after init or configure)."""
+        if cls.__metrics is None:
+            cls.__metrics = Metrics()
+        return cls.__metrics
+
     @classproperty
     def cfg(cls):
-        """Return named tuple instance [AppConfig] of config settings [dict]."""
-        return cls.nt(cls.__config, 'AppConfig')
+        """Return named tuple instance [AppConfig] of config settings [dict] (made once after init or configure)."""
+        if cls.__cfg is None:
+            cls.__cfg = cls.nt(cls.__config, 'AppConfig')
+        return cls.__cfg
+
+    @classproperty
+    def config(cls) -> dict:
+        """Return a copy of resolved config settings [dict] (picklable, unlike App.cfg, so it can be passed to worker processes)."""
+        return copy.deepcopy(cls.__config)
+
+    @classmethod
+    def configure(cls, config: dict) -> None:
+        """Apply already resolved config settings [config] without any validation (e.g. in worker processes)."""
+        cls.__config = config
+        cls.__cfg = None
+        cls.__metrics = None
 
     @staticmethod
     def resolve_path(path: str) -> Path:
@@ -121,6 +226,16 @@ class App:
         """
         return Path(path).expanduser().resolve()
 
+    @staticmethod
+    def is_on(value) -> bool:
+        """
+        Return true if config setting [value] is on ('1', 'yes', 'true', 'on').
+
+        >>> App.is_on('Yes'), App.is_on(None), App.is_on('0')
+        (True, False, False)
+        """
+        return bool(value) and RawConfigParser.BOOLEAN_STATES.get(str(value).lower(), False)
+
     @staticmethod
     def nt(obj, name: str = None):
         """
@@ -187,21 +302,29 @@ class App:
         """Apply settings specified in Logging config section [lcfg]."""
         logging.basicConfig(**dict((key.replace('BASE_CONFIG_', '').lower(), lcfg[key]) for key in lcfg.keys() if type(key) == str and key.startswith('BASE_CONFIG_') and lcfg[key]))
         if lcfg['FILE_CFG'] and (file_cfg_path := cls.resolve_path(lcfg['FILE_CFG'])):
+            from logging import config as logging_config
             if file_cfg_path.suffix.lower() == '.yml':
+                import yaml  # https://pypi.org/project/PyYAML/
                 with open(str(file_cfg_path), 'rt') as file_cfg:
                     config_dict_yaml = yaml.safe_load(file_cfg.read())
-                    logging.config.dictConfig(config_dict_yaml)
+                    logging_config.dictConfig(config_dict_yaml)
             else:
-                logging.config.fileConfig(str(file_cfg_path), disable_existing_loggers=True)
+                logging_config.fileConfig(str(file_cfg_path), disable_existing_loggers=True)
         cls.__logger_name = {"__name__": __name__, "": None}.get(lcfg['LOGGER_NAME'], lcfg['LOGGER_NAME'])
         cls.__logger = logging.getLogger(cls.__logger_name)
 
     @classmethod
-    def init(cls, config_path: str) -> None:
-        """Initialize application properties (App.logger, App.cfg) by resolving config settings."""
+    def init(cls, config_path: str, overrides: dict = None) -> None:
+        """
+        Initialize application properties (App.logger, App.cfg) by resolving config settings.
+
+        Settings from [overrides] (e.g. command line options as {'Logs': {'WORKERS': '4'}}) take precedence over config file ones.
+        """
         if sys.version_info < cls.REQUIRED_PYTHON_VER:
             raise RuntimeError(f"This package requres Python {cls.REQUIRED_PYTHON_VER}+")
         config = cls.load_config(cls.resolve_path(config_path))
+        config = cls.merge_config(overrides or {}, config)
+        log_format_is_set = 'LOG_FORMAT' in config.get('Logs', {})
         config = cls.merge_config(config, cls.__default_config)
         cls.setup_logging(config['Logging'])
         # make spme basic validations
@@ -212,7 +335,20 @@ class App:
             path = App.resolve_path(path)
             if not path.exists() or not os.access(path, os.F_OK):
                 raise RuntimeError(f'App can"t run due to an error - {error_msg} {str(path)}')
+        if config['Stats']['ENGINE'] == 'columnar' and numpy_module() is None:
+            cls.logger.warning('NumPy is not installed, so "stream" statistics engine is used instead of "columnar" one.')
+        if config['Stats']['ENGINE'] == 'columnar' and numpy_module() is not None and config['Urls']['MAX_KEYS']:
+            cls.logger.warning('Urls.MAX_KEYS is ignored by "columnar" statistics engine.')
+        elif config['Urls']['MAX_KEYS'] and config['Report']['REPORT_SIZE'] and int(config['Urls']['MAX_KEYS']) < int(config['Report']['REPORT_SIZE']):
+            raise ValueError(f'Urls.MAX_KEYS ({config["Urls"]["MAX_KEYS"]}) is less than Report.REPORT_SIZE ({config["Report"]["REPORT_SIZE"]}), '
+                             f'so report would have less urls with inaccurate statistics of the last ones.')
+        if config['Logs']['LOG_FORMAT'] and not log_format_is_set and config['Logs']['LINE_FORMAT'] != cls.__default_config['Logs']['LINE_FORMAT']:
+            # default LOG_FORMAT describes lines of default LINE_FORMAT only, fast parser would accept lines which custom LINE_FORMAT doesn't match or parse them another way
+            cls.logger.warning('Logs.LINE_FORMAT is custom while Logs.LOG_FORMAT is the default one, so lines are parsed by LINE_FORMAT only (set LOG_FORMAT of these lines for fast line parser).')
+            config['Logs']['LOG_FORMAT'] = None
         cls.__config = config
+        cls.__cfg = None
+        cls.__metrics = None
 
     @classmethod
     def is_version_applicable(cls, version: str) -> bool:
@@ -220,151 +356,2227 @@ class App:
         return version.split(".")[:-1] == cls.__default_config['App']['VERSION'].split(".")[:-1]
 
 
-def main(app=App) -> int:
+@lru_cache(maxsize=None)
+def numpy_module():
+    """Return numpy module (optional, see Stats.ENGINE) imported on first call or None if it isn't installed."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+FileInfo = cs.namedtuple("FileInfo", ['path', 'cdt', 'ext'])
+RequestInfo = cs.namedtuple("RequestInfo", ['uri', 'time', 'status', 'method', 'time_local'], defaults=(None, None, None))  # status, method, time_local are parsed for Stats.DIMENSIONS only
+CHECKPOINT_VERSION = 2
+COMPRESSED_LOG_OPENERS = {'gz': gzip.open, 'bz2': bz2.open, 'xz': lzma.open, 'zst': zstandard.open if zstandard else None}
+EXTERNAL_DECOMPRESSORS = {'gz': (('pigz', '-dc'), ('gzip', '-dc')), 'bz2': (('lbzip2', '-dc'), ('pbzip2', '-dc'), ('bzip2', '-dc')),
+                          'xz': (('xz', '-dc'),), 'zst': (('zstd', '-dc'),)}  # in order of preference
+PARTIAL_MAGIC, PARTIAL_VERSION, PARTIAL_FILE_EXT = b'LAPS', 2, '.partial'
+CACHE_DIR_NAME = 'cache'  # subdirectory of Report.DIR with cached statistics of logs (see write_cache)
+
+
+def microseconds(seconds: float) -> int:
     """
-    main
+    Return [seconds] as integer number of microseconds.
 
-    Args:
-        App: application settings class
+    Sums of request times are kept in integer microseconds, so they are exact and don't depend on order of adding and merging
+    (parallel parsing gives the same sums as serial one), unlike float sums:
+    >>> sum(map(microseconds, [0.1, 0.2, 0.3])) == sum(map(microseconds, [0.3, 0.2, 0.1])), 0.1 + 0.2 + 0.3 == 0.3 + 0.2 + 0.1
+    (True, False)
+    """
+    return round(seconds * 1000000)
 
-    Returns:
-        -1 (or Exception raised) - smt unexpected
-        0 - ok
-        1 - no logs
-        2 - report exists
+
+class TimeStats:
     """
-    cfg = app.cfg
-    FileInfo = cs.namedtuple("FileInfo", ['path', 'cdt', 'ext'])
-    RequestInfo = cs.namedtuple("RequestInfo", ['uri', 'time'])
+    class TimeStats - mergeable bounded-memory statistics (count, sum, max, quantiles) of request times.
+
+    Times are kept as is while there are no more than [exact_limit] of them, so quantiles are exact (sum is kept in microseconds).
+    Then they are collapsed to a sketch - counts of log-scaled buckets (see DDSketch), which size doesn't depend
+    on number of times and which quantiles have relative error not greater than [relative_error]:
+    >>> exact, sketch = TimeStats(0.01, 10), TimeStats(0.01, 10)
+    >>> for time in range(1, 101):
+    ...     (exact if time <= 10 else sketch).add(float(time))
+    >>> exact.count, exact.total, exact.max, exact.quantile(0.5), exact.buckets
+    (10, 55.0, 10.0, 5.5, None)
+    >>> sketch.merge(exact).count, sketch.total, sketch.max, len(sketch.buckets) < 100, abs(sketch.quantile(0.5) - 50) / 50 <= 0.01
+    (100, 5050.0, 100.0, True, True)
+    """
+
+    __slots__ = ('relative_error', 'exact_limit', 'count', 'total_us', 'max', 'values', 'buckets', 'zero_count')
+    MIN_VALUE = 1e-9  # times less than MIN_VALUE are counted as zeros
+
+    def __init__(self, relative_error: float, exact_limit: int):
+        """Make empty statistics."""
+        self.relative_error = relative_error
+        self.exact_limit = exact_limit
+        self.count = 0
+        self.total_us = 0
+        self.max = None
+        self.values = []
+        self.buckets = None
+        self.zero_count = 0
+
+    @property
+    def total(self) -> float:
+        """Return sum of times (seconds)."""
+        return self.total_us / 1000000
+
+    def _gamma(self) -> float:
+        return (1 + self.relative_error) / (1 - self.relative_error)
+
+    def _collapse(self) -> None:
+        """Move exact values to sketch buckets."""
+        self.buckets, values, self.values = {}, self.values, None
+        self._add_values_to_sketch(values)
+
+    def _add_values_to_sketch(self, values: list) -> None:
+        """Add exact [values] to sketch buckets (the same as _add_to_sketch of every value, but without per value calls)."""
+        log_gamma, min_value, buckets, log, ceil = math.log(self._gamma()), self.MIN_VALUE, self.buckets, math.log, math.ceil
+        for value in values:
+            if value < min_value:
+                self.zero_count += 1
+            else:
+                key = ceil(log(value) / log_gamma)
+                buckets[key] = buckets.get(key, 0) + 1
+
+    def _add_to_sketch(self, value: float, count: int, log_gamma: float) -> None:
+        if value < self.MIN_VALUE:
+            self.zero_count += count
+        else:
+            key = math.ceil(math.log(value) / log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def add(self, time: float) -> None:
+        """Account request [time]."""
+        self.count += 1
+        self.total_us += round(time * 1000000)  # see microseconds
+        if self.max is None or time > self.max:
+            self.max = time
+        if self.buckets is None:
+            self.values.append(time)
+            if len(self.values) > self.exact_limit:
+                self._collapse()
+        else:
+            self._add_to_sketch(time, 1, math.log(self._gamma()))
+
+    def merge(self, other: 'TimeStats') -> 'TimeStats':
+        """Merge [other] statistics (made with the same settings) into self and return self."""
+        if other.relative_error != self.relative_error:
+            raise ValueError(f'Time statistics with different relative error ({self.relative_error} and {other.relative_error}) can"t be merged.')
+        self.count += other.count
+        self.total_us += other.total_us
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        if self.buckets is None and other.buckets is None:
+            self.values.extend(other.values)
+            if len(self.values) > self.exact_limit:
+                self._collapse()
+        else:
+            if self.buckets is None:
+                self._collapse()
+            if other.buckets is None:
+                self._add_values_to_sketch(other.values)
+            else:
+                self.zero_count += other.zero_count
+                for key, count in other.buckets.items():
+                    self.buckets[key] = self.buckets.get(key, 0) + count
+        return self
+
+    def to_state(self) -> list:
+        """Return state of statistics as list of JSON serializable values (see from_state)."""
+        return [self.count, self.total, self.max, self.values, None if self.buckets is None else list(self.buckets.items()), self.zero_count]
+
+    @classmethod
+    def from_state(cls, relative_error: float, exact_limit: int, state: list) -> 'TimeStats':
+        """Restore statistics from [state] made by to_state."""
+        time_stats = cls(relative_error, exact_limit)
+        time_stats.count, total, time_stats.max, time_stats.values, buckets, time_stats.zero_count = state
+        time_stats.total_us = microseconds(total)
+        time_stats.buckets = None if buckets is None else dict(buckets)
+        return time_stats
+
+    def quantile(self, q: float) -> float:
+        """Return [q]-quantile (0 <= q <= 1) of times (linear interpolation between closest ranks for exact values)."""
+        if not self.count:
+            return None
+        if self.buckets is None:
+            values = sorted(self.values)
+            fraction, index = math.modf((len(values) - 1) * q)
+            index = int(index)
+            return values[index] * (1 - fraction) + values[index + 1] * fraction if fraction else values[index]
+        rank, gamma = q * (self.count - 1), self._gamma()
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return min(2 * gamma ** key / (gamma + 1), self.max)
+        return self.max
+
+
+UrlSummary = cs.namedtuple("UrlSummary", ['url', 'count', 'total', 'max', 'quantiles'])
+
+
+class StreamRequests(dict):
+    """
+    class StreamRequests - statistics of request times by urls: {url: TimeStats}, updated line by line.
+
+    >>> requests = StreamRequests(0.01, 128)
+    >>> for uri, time in [('/a', 1.0), ('/b', 5.0), ('/a', 3.0)]:
+    ...     requests.add(uri, time)
+    >>> requests.summary([0.5], top=1)
+    [UrlSummary(url='/b', count=1, total=5.0, max=5.0, quantiles=(5.0,))]
+
+    If [max_keys] is set, then number of urls is bounded by space-saving heavy hitters algorithm: when there are 2 * [max_keys] urls,
+    only [max_keys] of them with max estimated total time are kept. Estimate is total time plus error: url which comes after eviction
+    may have been evicted earlier with total time up to [floor] (max estimate of evicted urls), so its error is [floor].
+    Top urls by total time are accurate while their total time is much greater than [floor]:
+    >>> requests = StreamRequests(0.01, 128, max_keys=2)
+    >>> for uri, time in [('/a', 9.0), ('/b', 1.0), ('/c', 2.0), ('/d', 0.5), ('/a', 1.0), ('/e', 3.0)]:
+    ...     requests.add(uri, time)
+    >>> sorted(requests), requests.floor, requests.errors
+    (['/a', '/c', '/e'], 1.0, {'/e': 1.0})
+    """
+
+    def __init__(self, relative_error: float, exact_limit: int, max_keys: int = None):
+        """Make empty statistics, see TimeStats for [relative_error] and [exact_limit]."""
+        super().__init__()
+        self.relative_error = relative_error
+        self.exact_limit = exact_limit
+        self.max_keys = max_keys
+        self.floor = 0  # max estimated total time of evicted urls
+        self.errors = {}  # url -> error of total time (floor at the moment url came)
+
+    def __missing__(self, uri: str) -> TimeStats:
+        time_stats = self[uri] = TimeStats(self.relative_error, self.exact_limit)
+        if self.floor:
+            self.errors[uri] = self.floor
+        return time_stats
+
+    def add(self, uri: str, time: float) -> None:
+        """Account request [time] of [uri]."""
+        self[uri].add(time)
+        if self.max_keys and len(self) >= 2 * self.max_keys:
+            self.evict()
+
+    def estimate(self, uri: str) -> float:
+        """Return estimate (upper bound) of total time of [uri]."""
+        return self[uri].total + self.errors.get(uri, 0)
+
+    def evict(self) -> None:
+        """Keep max_keys urls with max estimated total time only."""
+        kept = set(heapq.nlargest(self.max_keys, self, key=self.estimate))
+        for uri in [uri for uri in self if uri not in kept]:
+            self.floor = max(self.floor, self.estimate(uri))
+            del self[uri]
+            self.errors.pop(uri, None)
+
+    def merge(self, other: 'StreamRequests') -> 'StreamRequests':
+        """Merge [other] statistics into self and return self."""
+        if self.floor or other.floor:
+            # url which is absent in one of statistics may have been evicted there with total time up to its floor
+            for uri in self.keys() | other.keys():
+                error = (self.errors.get(uri, 0) if uri in self else self.floor) + (other.errors.get(uri, 0) if uri in other else other.floor)
+                if error:
+                    self.errors[uri] = error
+            self.floor += other.floor
+        for uri, time_stats in other.items():
+            if uri in self:
+                self[uri].merge(time_stats)
+            else:
+                dict.__setitem__(self, uri, TimeStats(self.relative_error, self.exact_limit).merge(time_stats))
+        if self.max_keys and len(self) >= 2 * self.max_keys:
+            self.evict()
+        return self
+
+    def to_state(self) -> dict:
+        """Return state of statistics as JSON serializable dict (see LogStats.from_state)."""
+        return {'engine': 'stream', 'relative_error': self.relative_error, 'exact_limit': self.exact_limit, 'max_keys': self.max_keys,
+                'floor': self.floor, 'errors': self.errors, 'urls': dict((uri, time_stats.to_state()) for uri, time_stats in self.items())}
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'StreamRequests':
+        """Restore statistics from [state] made by to_state."""
+        requests = cls(state['relative_error'], state['exact_limit'], state['max_keys'])
+        requests.floor, requests.errors = state['floor'], state['errors']
+        for uri, time_stats in state['urls'].items():
+            dict.__setitem__(requests, uri, TimeStats.from_state(requests.relative_error, requests.exact_limit, time_stats))
+        return requests
+
+    def summary(self, quantiles: list, top: int = None) -> list:
+        """Return [top] (None - all) UrlSummary items with [quantiles] of times, sorted by (estimated) total time (desc)."""
+        def sort_key(item):
+            return round(item[1].total + self.errors.get(item[0], 0), App.ROUND_NDIGITS)
+        items = heapq.nlargest(top, self.items(), key=sort_key) if top is not None else sorted(self.items(), key=sort_key, reverse=True)
+        return [UrlSummary(url, times.count, times.total, times.max, tuple(times.quantile(q) for q in quantiles)) for url, times in items]
+
+
+class ColumnarRequests:
+    """
+    class ColumnarRequests - statistics of request times by urls, calculated at once for all urls with NumPy.
+
+    Urls are interned to integer ids, ids and times are appended (by batches) to compact arrays (4 + 8 bytes per request).
+    Summary is made by group-by operations: bincount of sums and argpartition for top urls, then times of top urls are sorted
+    by (url, time), so their max and quantiles are taken by positions within groups.
+    Results are the same as for StreamRequests with exact quantiles:
+    >>> requests = ColumnarRequests()
+    >>> for uri, time in [('/a', 1.0), ('/b', 5.0), ('/a', 3.0), ('/c', 0.5)]:
+    ...     requests.add(uri, time)
+    >>> requests.summary([0.5, 1], top=2)
+    [UrlSummary(url='/b', count=1, total=5.0, max=5.0, quantiles=(5.0, 5.0)), UrlSummary(url='/a', count=2, total=4.0, max=3.0, quantiles=(2.0, 3.0))]
+    """
+
+    BATCH_SIZE = 65536
+
+    def __init__(self):
+        """Make empty statistics."""
+        self.url_ids = {}
+        self.ids = array('I')
+        self.times = array('d')
+        self._batch_ids, self._batch_times = [], []
+
+    def __len__(self) -> int:
+        return len(self.url_ids)
+
+    def __getstate__(self) -> dict:
+        self._flush()
+        return self.__dict__
+
+    def _flush(self) -> None:
+        """Move batch of added requests to arrays."""
+        self.ids.extend(self._batch_ids)
+        self.times.extend(self._batch_times)
+        self._batch_ids, self._batch_times = [], []
+
+    def add(self, uri: str, time: float) -> None:
+        """Account request [time] of [uri]."""
+        if (url_id := self.url_ids.get(uri)) is None:
+            url_id = self.url_ids[uri] = len(self.url_ids)
+        self._batch_ids.append(url_id)
+        self._batch_times.append(time)
+        if len(self._batch_ids) >= self.BATCH_SIZE:
+            self._flush()
+
+    def merge(self, other: 'ColumnarRequests') -> 'ColumnarRequests':
+        """Merge [other] statistics into self and return self."""
+        self._flush()
+        other._flush()
+        np = numpy_module()
+        url_ids = np.fromiter((self.url_ids.setdefault(url, len(self.url_ids)) for url in other.url_ids), dtype=np.uint32, count=len(other.url_ids))
+        self.ids.frombytes(url_ids[np.frombuffer(other.ids, dtype=np.uint32)].tobytes())
+        self.times.extend(other.times)
+        return self
+
+    def to_state(self) -> dict:
+        """Return state of statistics as JSON serializable dict (see LogStats.from_state)."""
+        self._flush()
+        return {'engine': 'columnar', 'urls': list(self.url_ids),
+                'ids': base64.b64encode(self.ids.tobytes()).decode(), 'times': base64.b64encode(self.times.tobytes()).decode()}
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'ColumnarRequests':
+        """Restore statistics from [state] made by to_state."""
+        requests = cls()
+        requests.url_ids = dict((url, url_id) for url_id, url in enumerate(state['urls']))
+        requests.ids.frombytes(base64.b64decode(state['ids']))
+        requests.times.frombytes(base64.b64decode(state['times']))
+        return requests
+
+    def to_stream(self, relative_error: float, exact_limit: int) -> StreamRequests:
+        """Return the same statistics as StreamRequests with [relative_error] and [exact_limit] settings."""
+        self._flush()
+        requests = StreamRequests(relative_error, exact_limit)
+        if self.url_ids:
+            np = numpy_module()
+            ids, times = np.frombuffer(self.ids, dtype=np.uint32), np.frombuffer(self.times, dtype=np.float64)
+            order = np.argsort(ids, kind='stable')
+            ids, times = ids[order], times[order]
+            bounds = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+            urls = list(self.url_ids)
+            for url_id, group_times in zip(ids[np.r_[0, bounds]].tolist(), np.split(times, bounds)):
+                time_stats = requests[urls[url_id]]
+                for time in group_times.tolist():
+                    time_stats.add(time)
+        return requests
+
+    def summary(self, quantiles: list, top: int = None) -> list:
+        """Return [top] (None - all) UrlSummary items with [quantiles] of times, sorted by total time (desc)."""
+        self._flush()
+        if not self.url_ids:
+            return []
+        np = numpy_module()
+        ids, times = np.frombuffer(self.ids, dtype=np.uint32), np.frombuffer(self.times, dtype=np.float64)
+        counts = np.bincount(ids, minlength=len(self.url_ids))
+        # sums of integer microseconds are exact (below 2 ** 53), so they don't depend on order of requests
+        totals = np.bincount(ids, weights=np.rint(times * 1000000), minlength=len(self.url_ids)) / 1000000
+        sort_totals = np.round(totals, App.ROUND_NDIGITS)
+        top_ids = np.arange(len(self.url_ids))
+        if top is not None and top < len(top_ids):
+            threshold = sort_totals[np.argpartition(-sort_totals, top - 1)[top - 1]]
+            top_ids = np.flatnonzero(sort_totals >= threshold)  # with ties at threshold, which are resolved by order of urls as in StreamRequests
+        top_ids = top_ids[np.lexsort((top_ids, -sort_totals[top_ids]))][:top]
+        # sort times of top urls by (url id, time), so max and quantiles are taken by positions in groups
+        mask = np.zeros(len(self.url_ids), dtype=bool)
+        mask[top_ids] = True
+        selected = mask[ids]
+        group_ids, group_times = ids[selected], times[selected]
+        order = np.lexsort((group_times, group_ids))
+        group_ids, group_times = group_ids[order], group_times[order]
+        starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]])
+        group_index = np.empty(len(self.url_ids), dtype=np.int64)
+        group_index[group_ids[starts]] = np.arange(len(starts))
+        starts, group_counts = starts[group_index[top_ids]], counts[top_ids]
+        maxs = group_times[starts + group_counts - 1]
+        columns = []
+        for q in quantiles:
+            fractions, positions = np.modf((group_counts - 1) * q)
+            positions = starts + positions.astype(np.int64)
+            upper = np.minimum(positions + 1, starts + group_counts - 1)
+            columns.append(np.where(fractions > 0, group_times[positions] * (1 - fractions) + group_times[upper] * fractions, group_times[positions]))
+        urls = list(self.url_ids)
+        return [UrlSummary(urls[url_id], int(count), float(total), float(max_time), tuple(float(column[i]) for column in columns))
+                for i, (url_id, count, total, max_time) in enumerate(zip(top_ids.tolist(), group_counts, totals[top_ids], maxs))]
+
+
+@lru_cache(maxsize=4096)
+def time_bucket(time_local: str, minutes: int) -> str:
+    """
+    Return start 'YYYY-mm-dd HH:MM' of [minutes] long time bucket (of day) of nginx $time_local (its first 17 chars, up to minutes), None if it can't be parsed.
+
+    >>> time_bucket('29/Jun/2017:03:50', 15), time_bucket('29/Jun/2017:03:50', 60), time_bucket('-', 1)
+    ('2017-06-29 03:45', '2017-06-29 03:00', None)
+    """
+    try:
+        moment = datetime.strptime(time_local, '%d/%b/%Y:%H:%M')
+    except ValueError:
+        return None
+    minute = (moment.hour * 60 + moment.minute) // minutes * minutes
+    return f'{moment:%Y-%m-%d} {minute // 60 % 24:02}:{minute % 60:02}'
+
+
+class DimensionKey:
+    """
+    class DimensionKey - callable which returns key of RequestInfo in [dimension] (see Stats.DIMENSIONS), '-' if request has no needed field.
+
+    >>> request_info = RequestInfo('/a', 1.0, '503', 'GET', '29/Jun/2017:03:50:22 +0300')
+    >>> [DimensionKey(dimension)(request_info) for dimension in ('status', 'status_class', 'method', '15m', 'hour')], DimensionKey('1h')(RequestInfo('/a', 1.0))
+    (['503', '5xx', 'GET', '2017-06-29 03:45', '2017-06-29 03:00'], '-')
+    """
+
+    FIELDS = {'status': 'status', 'status_class': 'status', 'method': 'method'}  # dimensions by RequestInfo fields
+    TIME_UNITS = {'m': 1, 'h': 60}  # minutes of units of time buckets
+    ALIASES = {'minute': '1m', 'hour': '1h'}
+
+    def __init__(self, dimension: str):
+        """Check [dimension] and prepare its key getter. Raise ValueError if dimension is unknown."""
+        self.dimension, self.minutes = dimension, None
+        if dimension in self.FIELDS:
+            self.field = self.FIELDS[dimension]
+        elif match := re.fullmatch(r'([1-9]\d*)([mh])', self.ALIASES.get(dimension, dimension)):
+            self.field, self.minutes = 'time_local', int(match[1]) * self.TIME_UNITS[match[2]]
+        else:
+            raise ValueError(f'Unknown dimension [{dimension}], supported ones: {", ".join(self.FIELDS)}, <N>m, <N>h, {", ".join(self.ALIASES)}.')
+
+    @property
+    def is_time(self) -> bool:
+        """Return true if dimension is time buckets (its keys are sorted in time order)."""
+        return self.minutes is not None
+
+    def __call__(self, request_info: RequestInfo) -> str:
+        """Return key of [request_info] in dimension."""
+        value = getattr(request_info, self.field)
+        if value and self.minutes:
+            value = time_bucket(value[:17], self.minutes)
+        elif value and self.dimension == 'status_class':
+            value = f'{value[0]}xx'
+        return value or '-'
+
+
+def stats_dimensions(stats_cfg) -> list:
+    """Return list of dimensions of [stats_cfg.DIMENSIONS] (AppConfig.Stats)."""
+    return [dimension.strip() for dimension in (stats_cfg.DIMENSIONS or '').split(',') if dimension.strip()]
+
+
+class LogStats:
+    """
+    class LogStats - mergeable (partial) statistics of parsed log lines.
+
+    Request times by urls are kept by [requests] engine (StreamRequests by default, see Stats.ENGINE),
+    request times by keys of other [dimensions] (e.g. status, time buckets, see Stats.DIMENSIONS) are kept by StreamRequests in the same pass.
+    Mismatched lines are counted, up to [sample_size] distinct ones are kept as examples [line number, line] in [mismatch_samples]:
+    lines with the least hashes are chosen, so sample is the same for any split of log into parts.
+    Partials of consecutive parts of log are merged in log order, so merged result is the same as for serial parsing:
+    >>> a, b = LogStats(sample_size=2), LogStats(sample_size=2)
+    >>> a.add(RequestInfo('/a', 1.0)); a.add(None, b'x'); b.add(RequestInfo('/a', 2.0)); b.add(None, b'y'); b.add(None, b'x'); b.add(None, b'z')
+    >>> a.merge(b).line_count, a.mismatch_count, a.samples(), a.requests['/a'].values, a.total_time
+    (6, 4, [[1, 'x'], [5, 'z']], [1.0, 2.0], 3.0)
+    """
+
+    SAMPLE_LINE_LENGTH = 1000  # max length of kept example of mismatched line
+
+    def __init__(self, requests=None, sample_size: int = 10, dimensions: dict = None):
+        """Make empty statistics."""
+        self.line_count = 0
+        self.total_time_us = 0  # sum of request times in microseconds (see microseconds)
+        self.mismatch_count = 0
+        self.sample_size = sample_size
+        self.mismatch_samples = []  # [[hash, line number, line], ...]
+        self.requests = StreamRequests(0.01, 128) if requests is None else requests
+        self.dimensions = dimensions or {}  # {dimension: StreamRequests by keys of dimension}
+        self.dimension_keys = [(dimension, DimensionKey(dimension)) for dimension in self.dimensions]
+
+    @classmethod
+    def from_cfg(cls, cfg) -> 'LogStats':
+        """Make empty statistics according to [cfg.Stats] (AppConfig.Stats) settings."""
+        sample_size = int(cfg.Logs.MISMATCH_SAMPLES or 0)
+        relative_error, exact_limit = float(cfg.Stats.QUANTILE_RELATIVE_ERROR), int(cfg.Stats.QUANTILE_EXACT_LIMIT)
+        dimensions = dict((dimension, StreamRequests(relative_error, exact_limit)) for dimension in stats_dimensions(cfg.Stats))
+        if cfg.Stats.ENGINE == 'columnar' and numpy_module() is not None:
+            return cls(ColumnarRequests(), sample_size, dimensions)
+        return cls(StreamRequests(relative_error, exact_limit, int(cfg.Urls.MAX_KEYS) if cfg.Urls.MAX_KEYS else None), sample_size, dimensions)
+
+    @property
+    def total_time(self) -> float:
+        """Return sum of request times (seconds)."""
+        return self.total_time_us / 1000000
+
+    @property
+    def dimension_fields(self) -> set:
+        """Return RequestInfo fields (besides uri and time) needed by dimensions."""
+        return set(key.field for _, key in self.dimension_keys)
+
+    def add(self, request_info: RequestInfo, log_line: bytes = b'') -> None:
+        """Account next log line [log_line] parsed as [request_info] (None - line is mismatched)."""
+        if request_info:
+            self.total_time_us += round(request_info.time * 1000000)  # see microseconds
+            self.requests.add(request_info.uri, request_info.time)
+            for dimension, key in self.dimension_keys:
+                self.dimensions[dimension].add(key(request_info), request_info.time)
+        else:
+            self.mismatch_count += 1
+            self.sample([zlib.crc32(log_line), self.line_count, log_line[:self.SAMPLE_LINE_LENGTH].decode(App.ENCONDING, errors='replace')])
+        self.line_count += 1
+
+    def sample(self, mismatch_sample: list) -> None:
+        """Keep [mismatch_sample] ([hash, line number, line]) if its line is new and its hash is among [sample_size] least ones."""
+        samples = self.mismatch_samples
+        if any(sample[2] == mismatch_sample[2] for sample in samples):
+            return
+        if len(samples) < self.sample_size:
+            samples.append(mismatch_sample)
+        elif samples and mismatch_sample[0] < (largest := max(samples))[0]:
+            samples[samples.index(largest)] = mismatch_sample
+
+    def samples(self) -> list:
+        """Return examples of mismatched lines [[line number, line], ...] in order of lines."""
+        return sorted(sample[1:] for sample in self.mismatch_samples)
 
-    def actual_log_info(log_cfg) -> FileInfo:
+    def merge(self, other: 'LogStats') -> 'LogStats':
+        """Merge statistics [other] of the next part of log into self and return self."""
+        for mismatch_hash, line_number, line in other.mismatch_samples:
+            self.sample([mismatch_hash, line_number + self.line_count, line])
+        self.mismatch_count += other.mismatch_count
+        self.line_count += other.line_count
+        self.total_time_us += other.total_time_us
+        self.requests.merge(other.requests)
+        for dimension, requests in other.dimensions.items():
+            if dimension in self.dimensions:
+                self.dimensions[dimension].merge(requests)
+            else:
+                self.dimensions[dimension] = requests
+                self.dimension_keys.append((dimension, DimensionKey(dimension)))
+        return self
+
+    def to_state(self) -> dict:
+        """Return state of statistics as JSON serializable dict (see from_state)."""
+        return {'line_count': self.line_count, 'total_time': self.total_time, 'mismatch_count': self.mismatch_count, 'sample_size': self.sample_size,
+                'mismatch_samples': self.mismatch_samples, 'requests': self.requests.to_state(),
+                'dimensions': dict((dimension, requests.to_state()) for dimension, requests in self.dimensions.items())}
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'LogStats':
+        """
+        Restore statistics from [state] made by to_state.
+
+        >>> stats = LogStats(dimensions={'status': StreamRequests(0.01, 128)}); stats.add(RequestInfo('/a', 1.0, '200')); stats.add(None, b'x')
+        >>> LogStats.from_state(json.loads(json.dumps(stats.to_state()))).to_state() == stats.to_state(), list(stats.dimensions['status'])
+        (True, ['200'])
+        """
+        stats = cls({'stream': StreamRequests, 'columnar': ColumnarRequests}[state['requests']['engine']].from_state(state['requests']), state['sample_size'],
+                    dict((dimension, StreamRequests.from_state(requests)) for dimension, requests in state.get('dimensions', {}).items()))
+        stats.line_count, total_time, stats.mismatch_count, stats.mismatch_samples = itemgetter('line_count', 'total_time', 'mismatch_count', 'mismatch_samples')(state)
+        stats.total_time_us = microseconds(total_time)
+        return stats
+
+
+class MismatchLimitError(RuntimeError):
+    """Share of mismatched log lines exceeds Logs.UNMATCHED_LINE_LIMIT."""
+
+
+def mismatch_limit_exceeded(mismatch_count: int, line_count: int, limit: float, z: float) -> bool:
+    """
+    Return true if share of mismatched lines exceeds [limit] with confidence given by [z] score, i.e. lower bound of Wilson score interval of share is above [limit].
+
+    >>> z = NormalDist().inv_cdf(0.9999)
+    >>> mismatch_limit_exceeded(20, 20, 0.1, z), mismatch_limit_exceeded(3, 20, 0.1, z), mismatch_limit_exceeded(300, 2000, 0.1, z)
+    (True, False, True)
+    """
+    share, z2 = mismatch_count / line_count, z * z / line_count
+    return (share + z2 / 2 - z * math.sqrt(share * (1 - share) / line_count + z2 / line_count / 4)) / (1 + z2) > limit
+
+
+class StageMetrics:
+    """Accumulated measurements of run stage: number of calls, wall and cpu time (in seconds), number of processed items and bytes."""
+
+    __slots__ = ('calls', 'wall', 'cpu', 'items', 'bytes')
+
+    def __init__(self):
+        """Make empty measurements."""
+        self.calls, self.wall, self.cpu, self.items, self.bytes = 0, 0.0, 0.0, 0, 0
+
+    def to_dict(self) -> dict:
+        """Return measurements as dict with items/sec and bytes/sec rates."""
+        return {'calls': self.calls, 'wall': self.wall, 'cpu': self.cpu, 'items': self.items, 'bytes': self.bytes,
+                'items_per_sec': self.items / self.wall if self.wall else 0, 'bytes_per_sec': self.bytes / self.wall if self.wall else 0}
+
+
+class Metrics:
+    """
+    Timing instrumentation of log processing: measurements of stages (see StageMetrics) and totals of processed log (lines, mismatches).
+
+    Cpu time of stage includes cpu time of worker processes terminated within stage.
+    >>> metrics = Metrics()
+    >>> with metrics.stage('scan') as stage:
+    ...     stage.items += 3
+    >>> parse = metrics.timed('match', len)
+    >>> parse('line'), parse('next line')
+    (4, 9)
+    >>> metrics.stages['scan'].items, metrics.stages['match'].calls, metrics.stages['match'].items
+    (3, 2, 2)
+    """
+
+    def __init__(self):
+        """Make empty metrics."""
+        self.stages = {}  # stage name -> StageMetrics, in order of the first call
+        self.totals = {}  # e.g. lines, mismatches
+
+    @staticmethod
+    def cpu_time() -> float:
+        """Return cpu time of current process and its terminated children."""
+        if resource is None:
+            return time.process_time()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return time.process_time() + children.ru_utime + children.ru_stime
+
+    def get(self, name: str) -> StageMetrics:
+        """Return measurements of stage [name]."""
+        if (stage := self.stages.get(name)) is None:
+            stage = self.stages[name] = StageMetrics()
+        return stage
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure wall and cpu time of block as stage [name]. Block can account processed items and bytes in yielded StageMetrics."""
+        stage = self.get(name)
+        wall, cpu = time.perf_counter(), self.cpu_time()
+        try:
+            yield stage
+        finally:
+            stage.calls += 1
+            stage.wall += time.perf_counter() - wall
+            stage.cpu += self.cpu_time() - cpu
+
+    def timed(self, name: str, func):
+        """Return wrapper of [func] which accounts every call (as an item) and its wall time to stage [name]. Cpu time isn't measured."""
+        stage, clock = self.get(name), time.perf_counter
+
+        def timed_func(*args):
+            start = clock()
+            result = func(*args)
+            stage.wall += clock() - start
+            stage.calls += 1
+            stage.items += 1
+            return result
+        return timed_func
+
+    def timed_iter(self, name: str, iterable):
+        """Return generator of [iterable] items which accounts every item and wall time of getting it to stage [name]."""
+        stage, clock, iterator = self.get(name), time.perf_counter, iter(iterable)
+        stage.calls += 1
+
+        def timed_items():
+            while True:
+                start = clock()
+                item = next(iterator, None)
+                stage.wall += clock() - start
+                if item is None:
+                    return
+                stage.items += 1
+                yield item
+        return timed_items()
+
+    def merge(self, other: 'Metrics') -> 'Metrics':
+        """
+        Add measurements of stages and totals of [other] metrics (e.g. of another log processed by worker process) to self and return self.
+
+        >>> metrics, other = Metrics(), Metrics()
+        >>> with metrics.stage('scan') as stage:
+        ...     stage.items += 3
+        >>> with other.stage('scan') as stage:
+        ...     stage.items += 2
+        >>> other.totals.update(lines=10)
+        >>> metrics.merge(other).stages['scan'].items, metrics.stages['scan'].calls, metrics.totals
+        (5, 2, {'lines': 10})
         """
-        Look up files with [log_cfg.FILE_NAME_PREFIX] base name prefix in [log_cfg.DIR] directory.
+        for name, other_stage in other.stages.items():
+            stage = self.get(name)
+            for key in StageMetrics.__slots__:
+                setattr(stage, key, getattr(stage, key) + getattr(other_stage, key))
+        for key, value in other.totals.items():
+            self.totals[key] = self.totals.get(key, 0) + value
+        return self
 
-        Args:
-            log_cfg (AppConfig.Logs): with properties [DIR ('logs'), FILE_NAME_PREFIX ('nginx-access-ui.log-'), FILE_NAME_DATE_FORMAT ('%Y%m%d')]
+    def summary(self) -> dict:
+        """Return metrics as JSON serializable dict: stages, totals and rates of parsing (lines/sec, bytes/sec) and mismatch rate."""
+        parse = self.stages.get('parse', StageMetrics())
+        lines, mismatches = self.totals.get('lines', 0), self.totals.get('mismatches', 0)
+        return {'timestamp': time.time(), 'stages': dict((name, stage.to_dict()) for name, stage in self.stages.items()), 'totals': dict(self.totals),
+                'lines_per_sec': parse.items / parse.wall if parse.wall else 0, 'bytes_per_sec': parse.bytes / parse.wall if parse.wall else 0,
+                'mismatch_rate': mismatches / lines if lines else 0}
 
-        Returns:
-            FileInfo: (path: Path, cdt: datetime, ext: str) or None if not found
+    def to_prometheus(self, prefix: str = 'log_analyzer') -> str:
         """
-#       (logs := sorted(list(f for f in log_dir.glob(f"{config['Logs']['FILE_PREFIX']}*") if f.is_file()),
-#                     key = lambda s: datetime.strptime(wosuffixes(s.name[len(config['Logs']["FILE_PREFIX"]):]), config['Logs']['FILE_DATE_FORMAT']).date(),
-#                     reverse=True)):
-        file_info = FileInfo(None, datetime.min, None)
-        for file_path in Path(app.resolve_path(log_cfg.DIR)).iterdir():
-            if file_path.is_file() and (file_path.name.startswith(log_cfg.FILE_NAME_PREFIX) if log_cfg.FILE_NAME_PREFIX else True):
-                ext = ".".join(file_path.name[len(log_cfg.FILE_NAME_PREFIX):].split('.')[log_cfg.FILE_NAME_DATE_FORMAT.count(".")+1:])
-                cdt = file_path.name.lstrip(log_cfg.FILE_NAME_PREFIX).rstrip(f'.{ext}')
-                with suppress(ValueError, TypeError):
-                    cdt = datetime.strptime(cdt, log_cfg.FILE_NAME_DATE_FORMAT)
-                if type(cdt) != datetime:
-                    continue
-                if cdt > file_info.cdt:
-                    file_info = FileInfo(file_path, cdt, ext)
-        return file_info if file_info.path else None
-
-    def generate_report_file_name(report_cfg, log_file_info: FileInfo) -> Path:
+        Return metrics in Prometheus text exposition format (e.g. for textfile collector of node_exporter).
+
+        >>> metrics = Metrics()
+        >>> with metrics.stage('parse') as stage:
+        ...     stage.items += 10
+        >>> print(metrics.to_prometheus()[:150])
+        # HELP log_analyzer_stage_wall_seconds Wall time of stage.
+        # TYPE log_analyzer_stage_wall_seconds gauge
+        log_analyzer_stage_wall_seconds{stage="parse"}
         """
-        Generate report's file name as follows...
+        summary, lines = self.summary(), []
+        for key, name, help_text in (('wall', 'stage_wall_seconds', 'Wall time of stage.'), ('cpu', 'stage_cpu_seconds', 'Cpu time of stage.'),
+                                     ('calls', 'stage_calls', 'Number of calls of stage.'), ('items', 'stage_items', 'Number of items processed by stage.'),
+                                     ('bytes', 'stage_bytes', 'Number of bytes processed by stage.')):
+            lines.extend((f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} gauge'))
+            lines.extend(f'{prefix}_{name}{{stage="{stage}"}} {values[key]!r}' for stage, values in summary['stages'].items())
+        for key, help_text in [('lines_per_sec', 'Parsed lines per second.'), ('bytes_per_sec', 'Parsed bytes of log per second.'), ('mismatch_rate', 'Share of mismatched lines.'),
+                               ('timestamp', 'Time of metrics collection.')] + [(key, f'Total number of {key} of log.') for key in summary['totals']]:
+            value = summary['totals'][key] if key in summary['totals'] else summary[key]
+            lines.extend((f'# HELP {prefix}_{key} {help_text}', f'# TYPE {prefix}_{key} gauge', f'{prefix}_{key} {value!r}'))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, metrics_path: Path) -> None:
+        """Save metrics to [metrics_path] file atomically: in Prometheus text format if its ext is .prom, else JSON."""
+        # temp file of process, so concurrent saves don't replace each other's temp files
+        temp_path = metrics_path.with_name(f'{metrics_path.name}.{os.getpid()}.tmp')
+        with open(temp_path, 'wt', encoding=App.ENCONDING) as metrics_file:
+            metrics_file.write(self.to_prometheus() if metrics_path.suffix == '.prom' else json.dumps(self.summary(), indent=2))
+        os.replace(temp_path, metrics_path)
+
+    def log(self, logger) -> None:
+        """Log measurements of stages and rates to [logger]."""
+        summary = self.summary()
+        for name, stage in summary['stages'].items():
+            logger.info(f'Stage {name}: wall {stage["wall"]:.3f}s, cpu {stage["cpu"]:.3f}s, calls {stage["calls"]}, items {stage["items"]} ({stage["items_per_sec"]:,.0f}/s)'
+                        + (f', bytes {stage["bytes"]} ({stage["bytes_per_sec"] / (1 << 20):,.1f} MB/s)' if stage['bytes'] else ''))
+        logger.info(f'Parsing: {summary["lines_per_sec"]:,.0f} lines/s, {summary["bytes_per_sec"] / (1 << 20):,.1f} MB/s, mismatch rate {summary["mismatch_rate"]:.4%}.')
+
+
+def is_compressed(log_file_info: FileInfo) -> bool:
+    """Return true if log file [log_file_info] is compressed (by its extension)."""
+    return log_file_info.ext in COMPRESSED_LOG_OPENERS
+
+
+@contextmanager
+def open_log(log_file_info: FileInfo, app=App):
+    """
+    Open log file [log_file_info] for binary reading of its (decompressed) content.
+
+    Compressed logs are decompressed by modules gzip, bz2, lzma, zstandard or, according to Logs.DECOMPRESSOR,
+    by the first found external tool of EXTERNAL_DECOMPRESSORS which runs in separate process.
+    """
+    path, ext = str(log_file_info.path), log_file_info.ext
+    if not is_compressed(log_file_info):
+        with open(path, 'rb') as log:
+            yield log
+        return
+    opener = COMPRESSED_LOG_OPENERS[ext]
+    if app.cfg.Logs.DECOMPRESSOR == 'external' or opener is None:
+        if command := next((command for command in EXTERNAL_DECOMPRESSORS[ext] if shutil.which(command[0])), None):
+            process = subprocess.Popen([*command, path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=app.READ_SIZE)
+            try:
+                yield process.stdout
+            finally:
+                if complete := not process.stdout.peek(1):  # content is read to the end
+                    error = process.stderr.read().decode(errors='replace').strip()
+                else:
+                    process.kill()
+                process.stdout.close()
+                process.stderr.close()
+                if process.wait() and complete:
+                    raise OSError(f'Decompression of log file {path} by {" ".join(command)} is failed ({process.returncode}): {error}')
+            return
+        if opener is None:
+            raise RuntimeError(f'zstandard module or zstd tool is required to read log file {path}.')
+    with opener(path, 'rb') as log:
+        yield log
+
+
+def split_lines(chunks) -> bytes:
+    """
+    Return generator of lines (bytes without line break) of content given by binary [chunks].
+
+    >>> list(split_lines([b'a\\r\\nb', b'c\\n', b'\\nd\\r', b'\\ne']))
+    [b'a', b'bc', b'', b'd', b'e']
+    """
+    rest = b''
+    for chunk in chunks:
+        if (last_break := chunk.rfind(b"\n")) < 0:
+            rest += chunk
+            continue
+        content = rest + chunk[:last_break] if rest else chunk[:last_break]
+        rest = chunk[last_break + 1:]
+        yield from (line.rstrip(b"\r") for line in content.split(b"\n")) if b"\r" in content else content.split(b"\n")
+    if rest:
+        yield rest.rstrip(b"\r")
+
+
+def log_lines(log_file_info: FileInfo, start: int = 0, end: int = None, app=App) -> bytes:
+    """
+    Return generator of [log_file_info.path] file lines (bytes without line break).
+
+    For plain (not compressed) files only lines which start within byte range [start, end) are returned,
+    where [start] should point to the beginning of line (see log_ranges). Plain files are memory mapped and split into lines
+    by chunks of App.READ_SIZE bytes, compressed ones are decompressed by chunks of the same size (see open_log).
+    """
+    if is_compressed(log_file_info):
+        with open_log(log_file_info, app) as log:
+            yield from split_lines(iter(partial(log.read, app.READ_SIZE), b''))
+        return
+    with open(str(log_file_info.path), 'rb') as log:
+        if (size := os.fstat(log.fileno()).st_size) <= start:
+            return
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            # the last line which starts within range is read to its end
+            end = size if end is None or end >= size else content.find(b"\n", max(end - 1, start)) + 1 or size
+            yield from split_lines(content[position:min(position + app.READ_SIZE, end)] for position in range(start, end, app.READ_SIZE))
+
+
+def log_ranges(log_file_info: FileInfo, chunk_size: int, start: int = 0, end: int = None) -> list:
+    """
+    Split plain (not compressed) log file [log_file_info] into line-aligned byte ranges [(start, end), ...] of [chunk_size] approximately.
+
+    Only part of file [start, end) is split (end = None - file size), [start] should point to the beginning of line.
+    """
+    end = log_file_info.path.stat().st_size if end is None else end
+    bounds = [start]
+    with open(str(log_file_info.path), 'rb') as log:
+        while bounds[-1] + chunk_size < end:
+            log.seek(bounds[-1] + chunk_size - 1)
+            log.readline()  # move to the beginning of the next line
+            if (position := log.tell()) >= end:
+                break
+            bounds.append(position)
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def complete_lines_end(log_file_info: FileInfo, size: int) -> int:
+    """Return end position of the last complete (with line break) line of first [size] bytes of plain log file [log_file_info]."""
+    with open(str(log_file_info.path), 'rb') as log:
+        position = size
+        while position > 0:
+            block_start = max(0, position - 65536)
+            log.seek(block_start)
+            if (line_break := log.read(position - block_start).rfind(b"\n")) >= 0:
+                return block_start + line_break + 1
+            position = block_start
+    return 0
 
-        1. In [report_cfg.DIR] directory
-        2. File name:
-            a. starts with [report_cfg.FILE_NAME_PREFIX]
-            b. + log_file_info.cdt.strftime([report_cfg.FILE_NAME_DATE_FORMAT])
-            c. + [report_cfg.FILE_NAME_EXT] ext or template ext if None
 
-        Args:
-            report_cfg (AppConfig.Report): Report config object with keys [DIR, FILE_NAME_PREFIX, FILE_NAME_DATE_FORMAT, FILE_NAME_EXT]
-            log_file_info (FileInfo): contains .cdt property
+def log_segments(log_file_info: FileInfo, chunk_size: int, app=App) -> bytes:
+    """
+    Return generator of line-aligned segments (bytes) of decompressed content of [log_file_info] file.
+
+    Compressed streams can't be split into independently decodable parts without decompressing them,
+    so decompression is made sequentially while segments can be parsed in parallel (see parse_log_segment).
+    Chunks are split at their last line break and the rest is carried to the next segment (zstandard reader has no readline).
+    """
+    rest = b''
+    with open_log(log_file_info, app) as log:
+        while chunk := log.read(chunk_size):
+            if (last_break := chunk.rfind(b"\n")) < 0:
+                rest += chunk
+                continue
+            yield rest + chunk[:last_break + 1]
+            rest = chunk[last_break + 1:]
+    if rest:
+        yield rest
+
+
+def get_request_info(log_line: str, log_line_parser, fields: tuple = ()) -> RequestInfo:
+    """Parse [log_line] with [log_line_parser] compiled regex (and RequestInfo [fields] besides uri and time). Return RequestInfo or None if line doesn't match."""
+    if (groups := log_line_parser.search(log_line)) and (groupdict := groups.groupdict()):
+        with suppress(ValueError):
+            return RequestInfo(uri=str.lower(groupdict['request_url']), time=float(groupdict['request_time']),
+                               **dict((field, groupdict.get(LineParser.FIELD_GROUPS[field])) for field in fields))
+        # return RequestInfo(*(fn(arg) for fn, arg in zip([str.lower, float], itemgetter('request_url', 'request_time')(groups.groupdict()))))
+    return None
+
+
+class LineParser:
+    """
+    class LineParser - callable which parses log line (bytes) to RequestInfo (or None if line doesn't match).
+
+    Nginx [log_format] (if any) is compiled to fast extractor, which splits line by quotes (nginx escapes them in values),
+    skips parts of line with unused fields and checks the rest ones with small anchored patterns on bytes (see FIELD_PATTERNS).
+    The patterns make sure that [line_format] regex matches the line, so for default formats both paths give the same results.
+    Lines which fast extractor can't handle are parsed by [line_format] regex (see get_request_info).
+    RequestInfo [fields] besides uri and time (status, method, time_local) are parsed if they are needed only:
+    >>> parser = LineParser(App.cfg.Logs.LINE_FORMAT, App.cfg.Logs.LOG_FORMAT)
+    >>> line = b'1.2.3.4 -  - [29/Jun/2017:03:50:22 +0300] "GET /API/v2/Banner/1?a=1 HTTP/1.1" 200 927 "-" "Lynx" "-" "1-2" "-" 0.390'
+    >>> parser.fast_request_info(line)[:2], parser(line)[:2], parser(line.replace(b'927', b'-'))
+    (('/api/v2/banner/1', 0.39), ('/api/v2/banner/1', 0.39), None)
+    >>> parser = LineParser(App.cfg.Logs.LINE_FORMAT, App.cfg.Logs.LOG_FORMAT, fields=('status', 'method', 'time_local'))
+    >>> parser.fast_request_info(line) == parser(line.replace(b'"-" 0.390', b'0.390')) == RequestInfo('/api/v2/banner/1', 0.39, '200', 'GET', '29/Jun/2017:03:50:22 +0300')
+    True
+    """
+
+    NEEDED_FIELDS = ('request', 'request_time')
+    FIELD_GROUPS = {'status': 'status', 'method': 'request_method', 'time_local': 'time_local'}  # RequestInfo fields by named groups of LINE_FORMAT and FIELD_PATTERNS
+    # patterns of field values which are equivalent to the constraints of default LINE_FORMAT regex, needed values are captured
+    FIELD_PATTERNS = {
+        'remote_addr': rb'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}',
+        'remote_user': rb'\S+',
+        'http_x_real_ip': rb'\S+',
+        'time_local': rb'(?P<time_local>.+)',
+        'request': rb'(?P<request_method>[A-Za-z]+) (?P<request_url>[\w\.\-/]+)(?:\?\S*)? .*',
+        'status': rb'(?P<status>\d{3})',
+        'body_bytes_sent': rb'\d+',
+        'http_referer': rb'\S*',
+        'request_time': rb'(?P<request_time>[\d\.]+)',
+    }
+
+    def __init__(self, line_format: str, log_format: str = None, encoding: str = App.ENCONDING, fields: tuple = ()):
+        """Compile [line_format] regex and fast extractor of nginx [log_format] (None - regex only) which parse RequestInfo [fields] besides uri and time."""
+        self.line_parser = re.compile(line_format, re.IGNORECASE)
+        self.encoding = encoding
+        self.fields = tuple(field for field in RequestInfo._fields if field in fields)
+        self.field_groups = tuple(self.FIELD_GROUPS[field] if field in fields else None for field in self.FIELD_GROUPS)  # in order of RequestInfo fields
+        groups = {'request_url', 'request_time', *(self.FIELD_GROUPS[field] for field in self.fields)}
+        self.parts_count, self.part_patterns, self.literal_parts = self.compile_log_format(log_format, groups) if log_format else (None, None, None)
+
+    @classmethod
+    def from_cfg(cls, log_cfg, fields: tuple = ()) -> 'LineParser':
+        """Return parser of RequestInfo [fields] besides uri and time according to [log_cfg] (AppConfig.Logs) settings (compiled once per process)."""
+        return cls.compiled(log_cfg.LINE_FORMAT, log_cfg.LOG_FORMAT, tuple(sorted(fields)))
+
+    @classmethod
+    @lru_cache(maxsize=16)
+    def compiled(cls, line_format: str, log_format: str, fields: tuple) -> 'LineParser':
+        """Return parser made by the same arguments before or new one."""
+        return cls(line_format, log_format, fields=fields)
+
+    @classmethod
+    def compile_log_format(cls, log_format: str, groups: set = frozenset(('request_url', 'request_time'))) -> tuple:
+        """
+        Compile nginx [log_format] to (number of quoted parts of line, [(part index, part pattern), ...], literal parts getter and values).
 
-        Returns:
-            Path: valid path for report file
+        Parts of line with unused (not needed nor checked) fields only are skipped, named [groups] of field patterns are captured only.
+        Return (None, None, None) if log_format can't be compiled.
         """
-        report_path = app.resolve_path(report_cfg.DIR)
-        report_path.mkdir(parents=True, exist_ok=True)
-        return report_path.joinpath(f'{report_cfg.FILE_NAME_PREFIX}{log_file_info.cdt.strftime(report_cfg.FILE_NAME_DATE_FORMAT)}{report_cfg.FILE_NAME_EXT if report_cfg.FILE_NAME_EXT else Path(report_cfg.TEMPLATE_FILE_PATH).suffix}')
-
-    def log_lines(log_file_info: FileInfo, mode='rt', encoding=app.ENCONDING) -> str:
-        """Return generator of [log_file_info.path] file lines."""
-        with {'gz': gzip.open, 'bz2': bz2.open}.get(log_file_info.ext, open)(str(log_file_info.path), mode, encoding=encoding) as log:
-            for line in log:
-                yield line.rstrip("\n")
-
-    def get_request_info(log_line: str, log_line_parser) -> RequestInfo:
-        if (groups := log_line_parser.search(log_line)) and (groupdict := groups.groupdict()):
-            with suppress(ValueError):
-                return RequestInfo(uri=str.lower(groupdict['request_url']), time=float(groupdict['request_time']))
-            # return RequestInfo(*(fn(arg) for fn, arg in zip([str.lower, float], itemgetter('request_url', 'request_time')(groups.groupdict()))))
+        parts = log_format.split('"')
+        fields = [field for part in parts for field in re.findall(r'\$(\w+)', part)]
+        if any(field not in fields for field in cls.NEEDED_FIELDS):
+            App.logger.warning(f'Log format [{log_format}] has no {cls.NEEDED_FIELDS} fields, so line format regex is used only.')
+            return None, None, None
+        part_patterns, literal_parts = [], {}
+        for index, part in enumerate(parts):
+            tokens = re.split(r'\$(\w+)', part)  # [literal, field, literal, ..., field, literal]
+            if len(tokens) == 1:
+                literal_parts[index] = part.encode()
+            elif any(field in cls.FIELD_PATTERNS for field in tokens[1::2]):
+                pattern = b''.join(re.escape(token.encode()) if i % 2 == 0 else cls.FIELD_PATTERNS.get(token, rb'.*?') for i, token in enumerate(tokens))
+                pattern = re.sub(rb'\(\?P<(\w+)>', lambda match: match[0] if match[1].decode() in groups else b'(?:', pattern)
+                part_patterns.append((index, re.compile(pattern)))
+        literal_parts = (itemgetter(*literal_parts, *literal_parts), tuple(literal_parts.values()) * 2) if literal_parts else None  # getter always returns tuple
+        return len(parts), part_patterns, literal_parts
+
+    def fast_request_info(self, log_line: bytes) -> RequestInfo:
+        """Parse [log_line] with fast extractor. Return RequestInfo or None if it can't handle the line."""
+        if self.part_patterns is None or not log_line.isascii():
+            return None
+        parts = log_line.split(b'"')
+        if len(parts) != self.parts_count or (self.literal_parts and self.literal_parts[0](parts) != self.literal_parts[1]):
+            return None
+        values = {}
+        for index, pattern in self.part_patterns:
+            if not (match := pattern.fullmatch(parts[index])):
+                return None
+            if match.lastgroup:
+                values.update(match.groupdict())
+        with suppress(ValueError):
+            if self.fields:
+                return RequestInfo(values['request_url'].decode().lower(), float(values['request_time']),
+                                   *[value.decode() if (value := values.get(group)) is not None else None for group in self.field_groups])
+            return RequestInfo(uri=values['request_url'].decode().lower(), time=float(values['request_time']))
+        return None
+
+    def __call__(self, log_line: bytes) -> RequestInfo:
+        """Parse [log_line] with fast extractor or with line format regex if it fails."""
+        return self.fast_request_info(log_line) or get_request_info(log_line.decode(self.encoding), self.line_parser, self.fields)
+
+
+class UrlNormalizer:
+    """
+    class UrlNormalizer - callable which collapses variable segments of url (ids, hashes, uuids) to templates by [rules].
+
+    Rules are lines '<regex> => <replacement>', which are applied in order. Results are cached for [cache_size] recent urls:
+    >>> normalize_url = UrlNormalizer(App.cfg.Urls.RULES)
+    >>> normalize_url('/api/v2/banner/25019354'), normalize_url('/e/0f8fad5b-d9cb-469f-a165-70867728950e/1'), normalize_url('/s/5d41402abc4b2a76b9719d911017c592')
+    ('/api/v2/banner/{id}', '/e/{uuid}/{id}', '/s/{hex}')
+    """
+
+    def __init__(self, rules: str, cache_size: int = 65536):
+        """Compile templating [rules]."""
+        self.rules = [(re.compile(pattern.strip()), replacement.strip()) for pattern, replacement in (rule.rsplit('=>', 1) for rule in rules.splitlines() if rule.strip())]
+        self.normalize = lru_cache(maxsize=cache_size)(self.normalize)
+
+    @classmethod
+    def from_cfg(cls, urls_cfg) -> 'UrlNormalizer':
+        """Return normalizer according to [urls_cfg] (AppConfig.Urls) settings (made once per process, so its cache stays warm). Return None if normalization is off."""
+        return cls.compiled(urls_cfg.RULES) if App.is_on(urls_cfg.NORMALIZE) else None
+
+    @classmethod
+    @lru_cache(maxsize=16)
+    def compiled(cls, rules: str) -> 'UrlNormalizer':
+        """Return normalizer made by the same [rules] before or new one."""
+        return cls(rules)
+
+    def normalize(self, url: str) -> str:
+        """Return template of [url]."""
+        for pattern, replacement in self.rules:
+            url = pattern.sub(replacement, url)
+        return url
+
+    def __call__(self, url: str) -> str:
+        """Return template of [url]."""
+        return self.normalize(url)
+
+
+def parse_lines(lines, cfg, metrics: Metrics = None, mismatch_budget: float = None) -> LogStats:
+    """
+    Parse log [lines] according to [cfg] (AppConfig) settings and return their statistics.
+
+    If [metrics] is set, then wall time of reading, matching, url normalization and statistics update of every line is accounted to its stages.
+    If [mismatch_budget] is set (see log_mismatch_budget), then parsing is aborted as soon as there are more mismatched lines.
+    """
+    stats = LogStats.from_cfg(cfg)
+    line_parser = LineParser.from_cfg(cfg.Logs, stats.dimension_fields)
+    normalize_url = UrlNormalizer.from_cfg(cfg.Urls)
+    add_stats = stats.add
+    if metrics is not None:
+        lines, line_parser, add_stats = metrics.timed_iter('read', lines), metrics.timed('match', line_parser), metrics.timed('stats', add_stats)
+        normalize_url = normalize_url and metrics.timed('normalize', normalize_url)
+    for log_line in lines:
+        # Log line example:
+        # b'1.196.116.32 -  - [29/Jun/2017:03:50:22 +0300] "GET /api/v2/banner/25019354 HTTP/1.1" 200 927 "-" "Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5" "-" "1498697422-2190034393-4708-9752759" "dc7161be3" 0.390'
+        request_info = line_parser(log_line)
+        if request_info and normalize_url:
+            request_info = request_info._replace(uri=normalize_url(request_info.uri))
+        add_stats(request_info, log_line)
+        if request_info is None and mismatch_budget is not None:
+            check_mismatch_budget(stats, mismatch_budget)
+    return stats
+
+
+def check_mismatch_budget(stats: LogStats, mismatch_budget: float) -> None:
+    """Raise MismatchLimitError if statistics [stats] of part of log have more mismatched lines than [mismatch_budget] of the whole log (see log_mismatch_budget)."""
+    if stats.mismatch_count > mismatch_budget:
+        raise MismatchLimitError(f'Mismatch limit has been exceeded: {stats.mismatch_count} of {stats.line_count} parsed lines are mismatched, '
+                                 f'while the whole log can have {int(mismatch_budget)} mismatched lines at most. Examples:\n{format_mismatch_samples(stats.samples())}')
+
+
+def mismatch_abort_settings(cfg) -> tuple:
+    """Return (Logs.UNMATCHED_LINE_LIMIT, z score of Logs.ABORT_CONFIDENCE) of [cfg] (AppConfig) or (None, None) if early abort is off."""
+    if not cfg.Logs.UNMATCHED_LINE_LIMIT or not cfg.Logs.ABORT_CONFIDENCE:
+        return None, None
+    return float(cfg.Logs.UNMATCHED_LINE_LIMIT), NormalDist().inv_cdf(float(cfg.Logs.ABORT_CONFIDENCE))
+
+
+def log_line_count(log_file_info: FileInfo, app=App) -> int:
+    """Return number of lines of plain (not compressed) log file [log_file_info], the last one can be without line break."""
+    with open(str(log_file_info.path), 'rb') as log:
+        if not (size := os.fstat(log.fileno()).st_size):
+            return 0
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            return sum(content[position:position + app.READ_SIZE].count(b"\n") for position in range(0, size, app.READ_SIZE)) + (content[size - 1] != ord("\n"))
+
+
+def log_mismatch_budget(log_file_info: FileInfo, app=App) -> float:
+    """
+    Return max number of mismatched lines of log file [log_file_info] within Logs.UNMATCHED_LINE_LIMIT: the limit share of all its (current) lines.
+
+    Any part of log with more mismatched lines means that the whole log exceeds the limit regardless of the rest of it, so its parsing can be aborted.
+    None if early abort is off (see mismatch_abort_settings) or log is compressed (number of its lines is unknown before parsing).
+    """
+    limit, abort_z = mismatch_abort_settings(app.cfg)
+    if abort_z is None or is_compressed(log_file_info):
         return None
+    return limit * log_line_count(log_file_info, app)
+
+
+def format_mismatch_samples(samples: list) -> str:
+    """Return text of examples of mismatched lines [[line number, line], ...] (line numbers are 1-based)."""
+    return "\n".join(f'{line_number + 1}: {line}' for line_number, line in samples)
+
+
+def sample_log_lines(log_file_info: FileInfo, sample_size: int, app=App) -> list:
+    """
+    Return up to [sample_size] lines (bytes without line break) of log file [log_file_info].
+
+    Lines of plain log are spread across file (they are found by seeks), compressed log can't be sought, so its first lines are returned.
+    """
+    if is_compressed(log_file_info):
+        return list(islice(log_lines(log_file_info, app=app), sample_size))
+    lines, starts = [], set()
+    size = log_file_info.path.stat().st_size
+    with open(str(log_file_info.path), 'rb') as log:
+        for position in range(0, size, max(size // sample_size, 1)):
+            if position:
+                log.seek(position - 1)
+                log.readline()  # move to the beginning of the next line (line starting at position isn't skipped)
+            if (start := log.tell()) not in starts and (line := log.readline()):
+                starts.add(start)
+                lines.append(line.rstrip(b"\r\n"))
+    return lines
+
 
-    # process actual log file info
-    log_file_info = actual_log_info(cfg.Logs)
+def validate_log_format(log_file_info: FileInfo, app=App) -> bool:
+    """
+    Check Logs.VALIDATION_SAMPLE_SIZE lines of log file [log_file_info] (see sample_log_lines) before parsing.
+
+    Return false (and log error) if share of mismatched lines exceeds Logs.UNMATCHED_LINE_LIMIT with Logs.ABORT_CONFIDENCE.
+    The first lines of compressed log aren't a sample of the whole log (e.g. there can be a burst of broken lines), so it is rejected only if all of them are mismatched.
+    """
+    cfg = app.cfg
+    limit, abort_z = mismatch_abort_settings(cfg)
+    if abort_z is None or not cfg.Logs.VALIDATION_SAMPLE_SIZE or not int(cfg.Logs.VALIDATION_SAMPLE_SIZE):
+        return True
+    with app.metrics.stage('validate') as stage:
+        line_parser = LineParser.from_cfg(cfg.Logs)
+        lines = sample_log_lines(log_file_info, int(cfg.Logs.VALIDATION_SAMPLE_SIZE), app)
+        mismatched_lines = [line for line in lines if line_parser(line) is None]
+        stage.items += len(lines)
+    app.logger.debug(f'Validation of log file {log_file_info.path} format: {len(mismatched_lines)} of {len(lines)} sampled lines are mismatched.')
+    if lines and (len(mismatched_lines) == len(lines) if is_compressed(log_file_info) else mismatch_limit_exceeded(len(mismatched_lines), len(lines), limit, abort_z)):
+        examples = "\n".join(line[:LogStats.SAMPLE_LINE_LENGTH].decode(app.ENCONDING, errors='replace') for line in mismatched_lines[:int(cfg.Logs.MISMATCH_SAMPLES or 0)])
+        app.logger.error(f'Log file {log_file_info.path} doesn"t match format: {len(mismatched_lines)} of {len(lines)} sampled lines are mismatched. Examples:\n{examples}')
+        return False
+    return True
+
+
+def parse_log_range(config: dict, log_file_info: FileInfo, start: int, end: int, mismatch_budget: float = None) -> LogStats:
+    """Worker task: parse byte range [start, end) of plain log file [log_file_info] using app [config] settings (see parse_lines for [mismatch_budget])."""
+    return parse_lines(log_lines(log_file_info, start, end), App.nt(config, 'AppConfig'), mismatch_budget=mismatch_budget)
+
+
+def parse_log_segment(config: dict, segment: bytes) -> LogStats:
+    """Worker task: parse [segment] of decompressed log content using app [config] settings."""
+    lines = segment.split(b"\n")
+    if not lines[-1]:
+        lines.pop()
+    return parse_lines((line.rstrip(b"\r") for line in lines), App.nt(config, 'AppConfig'))
+
+
+def bounded_map(executor, fn, iterable, limit: int):
+    """
+    Return generator of fn(item) results (in order of [iterable] items) calculated by [executor].
+
+    Unlike executor.map, [iterable] is consumed lazily: no more than [limit] tasks are pending at any time.
+    """
+    pending = cs.deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def parse_log(log_file_info: FileInfo, app=App, start: int = 0, end: int = None, executor=None, mismatch_budget: float = None) -> LogStats:
+    """
+    Parse log file [log_file_info] and return its statistics.
+
+    For plain files only lines within byte range [start, end) are parsed (see log_lines), compressed files are parsed entirely.
+    If Logs.WORKERS isn't 1 then log is split into parts (line-aligned byte ranges for plain files or
+    decompressed segments for gz/bz2 ones), which are parsed by pool of processes ([executor] or new one).
+    Partial results are merged in log order, so they are the same as for serial parsing.
+    Parsing is aborted (MismatchLimitError) as soon as parsed lines have more mismatched ones than [mismatch_budget],
+    which is calculated by the whole log (see log_mismatch_budget) if log is parsed from the beginning.
+    """
+    cfg = app.cfg
+    workers = int(cfg.Logs.WORKERS or 1) or os.cpu_count()
+    with app.metrics.stage('parse') as stage:
+        if mismatch_budget is None and start == 0:
+            mismatch_budget = log_mismatch_budget(log_file_info, app)
+        if workers == 1:
+            stats = parse_lines(log_lines(log_file_info, start, end, app), cfg, app.metrics if app.is_on(cfg.Metrics.DETAILED) else None, mismatch_budget)
+        else:
+            chunk_size = int(cfg.Logs.CHUNK_SIZE)
+            stats = LogStats.from_cfg(cfg)
+            config = app.config
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) if executor is None else nullcontext(executor) as executor:
+                if is_compressed(log_file_info):
+                    partials = bounded_map(executor, partial(parse_log_segment, config), log_segments(log_file_info, chunk_size, app), 2 * workers)
+                else:
+                    partials = (future.result() for future in [executor.submit(parse_log_range, config, log_file_info, range_start, range_end, mismatch_budget)
+                                                               for range_start, range_end in log_ranges(log_file_info, chunk_size, start, end)])
+                for partial_stats in partials:
+                    stats.merge(partial_stats)
+                    if mismatch_budget is not None:
+                        check_mismatch_budget(stats, mismatch_budget)
+        # bytes of log file read (compressed logs are read entirely)
+        stage.items += stats.line_count
+        stage.bytes += log_file_info.path.stat().st_size - start if end is None or is_compressed(log_file_info) else end - start
+    return stats
+
+
+def log_fingerprint(log_file_info: FileInfo, head_size: int = 4096) -> dict:
+    """Return identity of log file [log_file_info]: path, inode, size, mtime and hash of its first [head_size] bytes."""
+    stat = log_file_info.path.stat()
+    with open(str(log_file_info.path), 'rb') as log:
+        head = log.read(head_size)
+    return {'path': str(log_file_info.path), 'inode': stat.st_ino, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'head_size': len(head), 'head_hash': hashlib.sha1(head).hexdigest()}
+
+
+def log_discontinuity(log_file_info: FileInfo, saved: dict, offset: int, fingerprint: dict) -> str:
+    """
+    Return why log file [log_file_info] with current [fingerprint] can't be continued from [offset] parsed when it had [saved] fingerprint, None if it can.
+
+    Log has been rotated or truncated if it has another path or inode, smaller size or another head content.
+    Compressed logs can't be continued from the middle, so they can't be continued if they have been changed at all.
+    """
+    if (saved['path'], saved['inode']) != (fingerprint['path'], fingerprint['inode']) or fingerprint['size'] < offset \
+            or log_fingerprint(log_file_info, saved['head_size'])['head_hash'] != saved['head_hash']:
+        return 'rotated or truncated'
+    if is_compressed(log_file_info) and (saved['size'], saved['mtime_ns']) != (fingerprint['size'], fingerprint['mtime_ns']):
+        return 'changed'
+    return None
+
+
+def stats_settings(cfg) -> dict:
+    """Return settings of [cfg] (AppConfig) which statistics of log depend on, so saved statistics (checkpoint, cache) are valid only for the same ones."""
+    return {'LINE_FORMAT': cfg.Logs.LINE_FORMAT, 'LOG_FORMAT': cfg.Logs.LOG_FORMAT, 'ENGINE': cfg.Stats.ENGINE,
+            'QUANTILE_RELATIVE_ERROR': cfg.Stats.QUANTILE_RELATIVE_ERROR, 'QUANTILE_EXACT_LIMIT': cfg.Stats.QUANTILE_EXACT_LIMIT, 'DIMENSIONS': cfg.Stats.DIMENSIONS,
+            'Urls': cfg.Urls._asdict()}
+
+
+def checkpoint_file_path(report_file_path: Path) -> Path:
+    """Return path of checkpoint file of incremental parsing for report [report_file_path]."""
+    return report_file_path.with_name(f'{report_file_path.name}.checkpoint')
+
+
+def load_checkpoint(checkpoint_path: Path, app=App) -> dict:
+    """Return checkpoint saved to [checkpoint_path] file or None if there is no valid one."""
+    if not checkpoint_path.exists():
+        return None
+    try:
+        with open(checkpoint_path, 'rt', encoding=app.ENCONDING) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint.get('version') == CHECKPOINT_VERSION:
+            return checkpoint
+    except (OSError, ValueError):
+        app.logger.exception(f'Checkpoint file [{checkpoint_path}] can"t be loaded.')
+    return None
+
+
+def save_checkpoint(checkpoint_path: Path, checkpoint: dict, app=App) -> None:
+    """Save [checkpoint] to [checkpoint_path] file atomically (so crash can't corrupt it)."""
+    temp_path = checkpoint_path.with_name(f'{checkpoint_path.name}.tmp')
+    with app.metrics.stage('checkpoint') as stage, open(temp_path, 'wt', encoding=app.ENCONDING) as checkpoint_file:
+        json.dump(dict(checkpoint, version=CHECKPOINT_VERSION), checkpoint_file)
+        stage.items += 1
+    os.replace(temp_path, checkpoint_path)
+
+
+def parse_log_incrementally(log_file_info: FileInfo, checkpoint_path: Path, app=App, fingerprint: dict = None) -> LogStats:
+    """
+    Parse log file [log_file_info] from checkpoint saved by previous run to [checkpoint_path] and return statistics of the whole log.
+
+    Log is parsed up to its size of [fingerprint] (see log_fingerprint, taken now if None).
+    Checkpoint (log file identity, byte offset and statistics of parsed lines) is saved after every Logs.CHECKPOINT_INTERVAL bytes of complete lines.
+    The last line without line break (being written or of finished log) is parsed too, but it isn't saved to checkpoint,
+    so it is parsed again by the next run (e.g. when it is complete). Log is parsed from the beginning if it has been rotated or truncated since checkpoint
+    (another path or inode, smaller size or another head content). Compressed logs can't be continued from the middle,
+    so they are parsed entirely unless they haven't been changed.
+    """
+    cfg = app.cfg
+    settings = stats_settings(cfg)
+    fingerprint = fingerprint or log_fingerprint(log_file_info)
+    compressed = is_compressed(log_file_info)
+    offset, stats = 0, LogStats.from_cfg(cfg)
+    if (checkpoint := load_checkpoint(checkpoint_path, app)) and checkpoint['settings'] == settings:
+        if reason := log_discontinuity(log_file_info, checkpoint['fingerprint'], checkpoint['offset'], fingerprint):
+            app.logger.info(f'Log file {log_file_info.path} has been {reason} since checkpoint, so it is parsed from the beginning.')
+        else:
+            offset, stats = checkpoint['offset'], LogStats.from_state(checkpoint['stats'])
+            app.logger.debug(f'Parsing of log file {log_file_info.path} is continued from checkpoint at {offset} byte.')
+    if compressed:
+        if not offset:
+            stats = parse_log(log_file_info, app)
+            save_checkpoint(checkpoint_path, {'settings': settings, 'fingerprint': fingerprint, 'offset': fingerprint['size'], 'stats': stats.to_state()}, app)
+        return stats
+    end = complete_lines_end(log_file_info, fingerprint['size'])
+    mismatch_budget = log_mismatch_budget(log_file_info, app) if not offset else None
+    for range_start, range_end in log_ranges(log_file_info, int(cfg.Logs.CHECKPOINT_INTERVAL), offset, end) if offset < end else []:
+        stats.merge(parse_log(log_file_info, app, range_start, range_end, mismatch_budget=mismatch_budget))
+        save_checkpoint(checkpoint_path, {'settings': settings, 'fingerprint': fingerprint, 'offset': range_end, 'stats': stats.to_state()}, app)
+    if end < fingerprint['size']:
+        stats.merge(parse_log(log_file_info, app, end, fingerprint['size'], mismatch_budget=mismatch_budget))
+    return stats
+
+
+def partial_file_path(report_file_path: Path) -> Path:
+    """Return path of partial statistics file (see write_partial) made instead of report [report_file_path] on this host."""
+    return report_file_path.with_suffix(f'.{socket.gethostname()}{PARTIAL_FILE_EXT}')
+
+
+def write_partial(partial_path: Path, stats: LogStats, meta: dict, app=App) -> None:
+    """
+    Save [stats] (with [meta] info, e.g. log date) to compact versioned binary partial file [partial_path], which can be merged with others.
+
+    Format: magic (4 bytes), version (uint16), then zlib compressed: length (uint32) of JSON header with totals and statistics settings,
+    number of urls (uint32) and url records: url length (uint16), url (utf-8), count (uint64), total, max and error of total time (doubles),
+    kind (uint8): 0 - exact times: number (uint32) and times (doubles), 1 - sketch: zero count (uint64), number of buckets (uint32),
+    bucket keys (int32) and counts (uint64). Since version 2: number of dimensions (uint16) and dimensions: name length (uint8), name (utf-8),
+    number of keys (uint32) and key records in the same format as url ones. All numbers are little-endian.
+    """
+    cfg = app.cfg
+    requests = stats.requests
+    if isinstance(requests, ColumnarRequests):
+        requests = requests.to_stream(float(cfg.Stats.QUANTILE_RELATIVE_ERROR), int(cfg.Stats.QUANTILE_EXACT_LIMIT))
+    header = dict(meta, settings=stats_settings(cfg), host=socket.gethostname(), line_count=stats.line_count, total_time=stats.total_time, mismatch_count=stats.mismatch_count,
+                  sample_size=stats.sample_size, mismatch_samples=stats.mismatch_samples,
+                  relative_error=requests.relative_error, exact_limit=requests.exact_limit, max_keys=requests.max_keys, floor=requests.floor)
+    header = json.dumps(header).encode()
+    compressor = zlib.compressobj()
+    temp_path = partial_path.with_name(f'{partial_path.name}.tmp')
+    with open(temp_path, 'wb') as partial_file:
+        partial_file.write(struct.pack('<4sH', PARTIAL_MAGIC, PARTIAL_VERSION))
+        partial_file.write(compressor.compress(struct.pack('<I', len(header)) + header))
+        for record in partial_records(requests):
+            partial_file.write(compressor.compress(record))
+        partial_file.write(compressor.compress(struct.pack('<H', len(stats.dimensions))))
+        for dimension, dimension_requests in stats.dimensions.items():
+            dimension_bytes = dimension.encode()
+            partial_file.write(compressor.compress(struct.pack(f'<B{len(dimension_bytes)}s', len(dimension_bytes), dimension_bytes)))
+            for record in partial_records(dimension_requests):
+                partial_file.write(compressor.compress(record))
+        partial_file.write(compressor.flush())
+    os.replace(temp_path, partial_path)
+
+
+def partial_records(requests: StreamRequests) -> bytes:
+    """Return generator of number of urls and url records of [requests] in partial file format (see write_partial)."""
+    yield struct.pack('<I', len(requests))
+    for url, times in requests.items():
+        url_bytes = url.encode()
+        record = [struct.pack(f'<H{len(url_bytes)}sQdddB', len(url_bytes), url_bytes, times.count, times.total, times.max, requests.errors.get(url, 0), times.buckets is not None)]
+        if times.buckets is None:
+            record.append(struct.pack(f'<I{len(times.values)}d', len(times.values), *times.values))
+        else:
+            record.append(struct.pack(f'<QI{len(times.buckets)}i{len(times.buckets)}Q', times.zero_count, len(times.buckets), *times.buckets.keys(), *times.buckets.values()))
+        yield b''.join(record)
+
+
+def read_partial(partial_path: Path) -> tuple:
+    """Load partial statistics file [partial_path] made by write_partial (of version 1 or later). Return (LogStats, header dict)."""
+    with open(partial_path, 'rb') as partial_file:
+        magic, version = struct.unpack('<4sH', partial_file.read(6))
+        if magic != PARTIAL_MAGIC or not 1 <= version <= PARTIAL_VERSION:
+            raise ValueError(f'File [{partial_path}] is not a partial statistics file of versions 1..{PARTIAL_VERSION}.')
+        body = zlib.decompress(partial_file.read())
+    header_size, = struct.unpack_from('<I', body)
+    header = json.loads(body[4:4 + header_size])
+    requests = StreamRequests(header['relative_error'], header['exact_limit'], header['max_keys'])
+    requests.floor = header['floor']
+    offset = read_partial_records(body, 4 + header_size, requests)
+    dimensions = {}
+    if version >= 2:
+        dimensions_count, = struct.unpack_from('<H', body, offset)
+        offset += 2
+        for _ in range(dimensions_count):
+            dimension_size, = struct.unpack_from('<B', body, offset)
+            dimension = body[offset + 1:offset + 1 + dimension_size].decode()
+            dimensions[dimension] = StreamRequests(header['relative_error'], header['exact_limit'])
+            offset = read_partial_records(body, offset + 1 + dimension_size, dimensions[dimension])
+    stats = LogStats(requests, header.get('sample_size', 0), dimensions)
+    stats.line_count, stats.total_time_us, stats.mismatch_count = header['line_count'], microseconds(header['total_time']), header['mismatch_count']
+    stats.mismatch_samples = header.get('mismatch_samples', [])
+    return stats, header
+
+
+def read_partial_records(body: bytes, offset: int, requests: StreamRequests) -> int:
+    """Load number of urls and url records (see partial_records) from [body] at [offset] to [requests]. Return offset of the rest of body."""
+    urls_count, = struct.unpack_from('<I', body, offset)
+    offset += 4
+    for _ in range(urls_count):
+        url_size, = struct.unpack_from('<H', body, offset)
+        url, count, total, max_time, error, kind = struct.unpack_from(f'<{url_size}sQdddB', body, offset + 2)
+        offset += 2 + struct.calcsize(f'<{url_size}sQdddB')
+        url, times = url.decode(), TimeStats(requests.relative_error, requests.exact_limit)
+        dict.__setitem__(requests, url, times)
+        times.count, times.total_us, times.max = count, microseconds(total), max_time
+        if error:
+            requests.errors[url] = error
+        if kind == 0:
+            values_count, = struct.unpack_from('<I', body, offset)
+            times.values = list(struct.unpack_from(f'<{values_count}d', body, offset + 4))
+            offset += 4 + 8 * values_count
+        else:
+            times.zero_count, buckets_count = struct.unpack_from('<QI', body, offset)
+            offset += 12
+            buckets = struct.unpack_from(f'<{buckets_count}i{buckets_count}Q', body, offset)
+            times.values, times.buckets = None, dict(zip(buckets[:buckets_count], buckets[buckets_count:]))
+            offset += 12 * buckets_count
+    return offset
+
+
+def read_partial_header(partial_path: Path) -> dict:
+    """Return JSON header of partial statistics file [partial_path] (see write_partial), only the beginning of file is decompressed."""
+    with open(partial_path, 'rb') as partial_file:
+        magic, version = struct.unpack('<4sH', partial_file.read(6))
+        if magic != PARTIAL_MAGIC or not 1 <= version <= PARTIAL_VERSION:
+            raise ValueError(f'File [{partial_path}] is not a partial statistics file of versions 1..{PARTIAL_VERSION}.')
+        decompressor, body = zlib.decompressobj(), b''
+        while len(body) < 4 or len(body) < 4 + struct.unpack_from('<I', body)[0]:
+            if not (chunk := partial_file.read(4096)):
+                raise ValueError(f'Partial statistics file [{partial_path}] is truncated.')
+            body += decompressor.decompress(chunk)
+    header_size, = struct.unpack_from('<I', body)
+    return json.loads(body[4:4 + header_size])
+
+
+def partial_settings(header: dict) -> dict:
+    """
+    Return settings of partial statistics file with [header] (see write_partial) which partials should share to be merged:
+    line format, url templating and dimensions (keys of statistics), relative error (buckets of sketches).
+    Partials made before settings were saved to header have relative error only.
+    """
+    settings = {'QUANTILE_RELATIVE_ERROR': header['relative_error']}
+    if stats_cfg := header.get('settings'):
+        settings.update({'LINE_FORMAT': stats_cfg['LINE_FORMAT'], 'DIMENSIONS': stats_cfg['DIMENSIONS'],
+                         'Urls.NORMALIZE': stats_cfg['Urls'].get('NORMALIZE'), 'Urls.RULES': stats_cfg['Urls'].get('RULES')})
+    return settings
+
+
+def settings_differences(headers: dict) -> list:
+    """
+    Return descriptions of settings (see partial_settings) which differ among partial statistics files [headers] {path: header}, empty list if they can be merged.
+
+    >>> settings_differences({'a': {'relative_error': 0.01}, 'b': {'relative_error': 0.02}}), settings_differences({'a': {'relative_error': 0.01}, 'b': {'relative_error': 0.01}})
+    (['QUANTILE_RELATIVE_ERROR (a: 0.01, b: 0.02)'], [])
+    """
+    settings = dict((path, partial_settings(header)) for path, header in headers.items())
+    differences = []
+    for name in dict.fromkeys(name for path_settings in settings.values() for name in path_settings):
+        values = dict((path, json.dumps(path_settings[name])) for path, path_settings in settings.items() if name in path_settings)
+        if len(set(values.values())) > 1:
+            differences.append(f'{name} ({", ".join(f"{path}: {value}" for path, value in values.items())})')
+    return differences
+
+
+def cache_file_path(report_cfg, log_file_info: FileInfo, app=App) -> Path:
+    """Return path of cached statistics of log file [log_file_info]: Report.DIR / cache / FILE_NAME_PREFIX + date in FILE_NAME_DATE_FORMAT + .partial."""
+    return app.resolve_path(report_cfg.DIR).joinpath(CACHE_DIR_NAME, f'{report_cfg.FILE_NAME_PREFIX}{log_file_info.cdt.strftime(report_cfg.FILE_NAME_DATE_FORMAT)}{PARTIAL_FILE_EXT}')
+
+
+def cache_key(log_file_info: FileInfo, fingerprint: dict, app=App) -> dict:
+    """Return key of cached statistics of log file [log_file_info] with [fingerprint] (see log_fingerprint): log path, date, size, mtime and statistics settings."""
+    return {'log': fingerprint['path'], 'date': log_file_info.cdt.isoformat(), 'size': fingerprint['size'], 'mtime_ns': fingerprint['mtime_ns'], 'settings': stats_settings(app.cfg)}
+
+
+def load_cache_header(cache_path: Path, app=App) -> dict:
+    """Return header of cached statistics file [cache_path] (with cache key, see cache_key) or None if there is no valid one."""
+    if not cache_path.exists():
+        return None
+    try:
+        return read_partial_header(cache_path)
+    except (OSError, ValueError, struct.error, zlib.error):
+        app.logger.exception(f'Cached statistics file [{cache_path}] can"t be loaded.')
+    return None
+
+
+def is_cache_fresh(header: dict, key: dict) -> bool:
+    """
+    Return true if cached statistics with [header] have been made of the same log (path, size, mtime) with the same settings as [key] (see cache_key).
+
+    >>> is_cache_fresh({'log': 'log1', 'size': 10, 'host': 'h'}, {'log': 'log1', 'size': 10}), is_cache_fresh({'log': 'log1', 'size': 10}, {'log': 'log1', 'size': 20})
+    (True, False)
+    """
+    return header is not None and all(header.get(name) == value for name, value in key.items())
+
+
+def write_cache(stats: LogStats, log_file_info: FileInfo, fingerprint: dict, app=App) -> None:
+    """Save statistics [stats] of log file [log_file_info] with [fingerprint] (see log_fingerprint) to cache file (see cache_file_path) in partial file format."""
+    cache_path = cache_file_path(app.cfg.Report, log_file_info, app)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    with app.metrics.stage('cache') as stage:
+        write_partial(cache_path, stats, cache_key(log_file_info, fingerprint, app), app)
+        stage.items += 1
+        stage.bytes += cache_path.stat().st_size
+    app.logger.debug(f'Statistics of log file {log_file_info.path} have been cached to file: {str(cache_path)}')
+
+
+def log_files_info(log_cfg, app=App) -> list:
+    """
+    Look up files with [log_cfg.FILE_NAME_PREFIX] base name prefix in [log_cfg.DIR] directory.
+
+    Args:
+        log_cfg (AppConfig.Logs): with properties [DIR ('logs'), FILE_NAME_PREFIX ('nginx-access-ui.log-'), FILE_NAME_DATE_FORMAT ('%Y%m%d')]
+
+    Returns:
+        list: [FileInfo: (path: Path, cdt: datetime, ext: str), ...] sorted by cdt (in directory order for the same cdt)
+    """
+#   (logs := sorted(list(f for f in log_dir.glob(f"{config['Logs']['FILE_PREFIX']}*") if f.is_file()),
+#                 key = lambda s: datetime.strptime(wosuffixes(s.name[len(config['Logs']["FILE_PREFIX"]):]), config['Logs']['FILE_DATE_FORMAT']).date(),
+#                 reverse=True)):
+    log_files = []
+    for file_path in Path(app.resolve_path(log_cfg.DIR)).iterdir():
+        if file_path.is_file() and (file_path.name.startswith(log_cfg.FILE_NAME_PREFIX) if log_cfg.FILE_NAME_PREFIX else True):
+            ext = ".".join(file_path.name[len(log_cfg.FILE_NAME_PREFIX):].split('.')[log_cfg.FILE_NAME_DATE_FORMAT.count(".")+1:])
+            cdt = file_path.name.lstrip(log_cfg.FILE_NAME_PREFIX).rstrip(f'.{ext}')
+            with suppress(ValueError, TypeError):
+                cdt = datetime.strptime(cdt, log_cfg.FILE_NAME_DATE_FORMAT)
+            if type(cdt) != datetime:
+                continue
+            log_files.append(FileInfo(file_path, cdt, ext))
+    return sorted(log_files, key=attrgetter('cdt'))
+
+
+def generate_report_file_name(report_cfg, log_file_info: FileInfo, app=App) -> Path:
+    """
+    Generate report's file name as follows...
+
+    1. In [report_cfg.DIR] directory
+    2. File name:
+        a. starts with [report_cfg.FILE_NAME_PREFIX]
+        b. + log_file_info.cdt.strftime([report_cfg.FILE_NAME_DATE_FORMAT])
+        c. + ext of the first format of [report_cfg.FORMATS] (see report_file_ext)
+
+    Args:
+        report_cfg (AppConfig.Report): Report config object with keys [DIR, FILE_NAME_PREFIX, FILE_NAME_DATE_FORMAT, FILE_NAME_EXT, FORMATS, COMPRESS]
+        log_file_info (FileInfo): contains .cdt property
+
+    Returns:
+        Path: valid path for report file
+    """
+    report_path = app.resolve_path(report_cfg.DIR)
+    report_path.mkdir(parents=True, exist_ok=True)
+    return report_path.joinpath(f'{report_cfg.FILE_NAME_PREFIX}{log_file_info.cdt.strftime(report_cfg.FILE_NAME_DATE_FORMAT)}{report_file_ext(report_formats(report_cfg)[0], report_cfg)}')
+
+
+def report_formats(report_cfg) -> list:
+    """Return list of formats of [report_cfg.FORMATS] (AppConfig.Report), 'template' if None."""
+    return [report_format.strip() for report_format in (report_cfg.FORMATS or 'template').split(',') if report_format.strip()] or ['template']
+
+
+def report_file_ext(report_format: str, report_cfg) -> str:
+    """
+    Return ext of report file in [report_format]: template ([report_cfg.FILE_NAME_EXT] or ext of template), csv or jsonl, + .gz if [report_cfg.COMPRESS] is on.
+
+    >>> report_file_ext('template', App.cfg.Report), report_file_ext('jsonl', App.cfg.Report)
+    ('.html', '.jsonl')
+    """
+    if report_format not in REPORT_WRITERS:
+        raise ValueError(f'Unknown report format [{report_format}], supported ones: {", ".join(REPORT_WRITERS)}.')
+    ext = f'.{report_format}' if report_format != 'template' else report_cfg.FILE_NAME_EXT or Path(report_cfg.TEMPLATE_FILE_PATH).suffix
+    return f'{ext}.gz' if App.is_on(report_cfg.COMPRESS) else ext
+
+
+def report_file_paths(report_file_path: Path, app=App) -> dict:
+    """Return {format: path} of report files of Report.FORMATS: the first one is [report_file_path], the others are next to it with their exts."""
+    report_cfg = app.cfg.Report
+    formats = report_formats(report_cfg)
+    main_ext, name = report_file_ext(formats[0], report_cfg), report_file_path.name
+    base_name = name[:-len(main_ext)] if main_ext and name.endswith(main_ext) else report_file_path.stem
+    return dict((report_format, report_file_path if i == 0 else report_file_path.with_name(f'{base_name}{report_file_ext(report_format, report_cfg)}'))
+                for i, report_format in enumerate(formats))
+
+
+def dimension_file_path(report_file_path: Path, report_format: str, dimension: str, app=App) -> Path:
+    """Return path of report file of [dimension] table (see Stats.DIMENSIONS) next to report file [report_file_path] in [report_format]."""
+    ext, name = report_file_ext(report_format, app.cfg.Report), report_file_path.name
+    return report_file_path.with_name(f'{name[:-len(ext)] if ext and name.endswith(ext) else report_file_path.stem}.{dimension}{ext}')
+
+
+def main(app=App) -> int:
+    """
+    main
+
+    Args:
+        App: application settings class
+
+    Returns:
+        -1 (or Exception raised) - smt unexpected
+        0 - ok
+        1 - no logs
+        2 - report exists
+    """
+    cfg = app.cfg
+
+    # process actual log file info (the first found one of the latest date)
+    with app.metrics.stage('scan') as stage:
+        log_files = log_files_info(cfg.Logs, app)
+        stage.items += len(log_files)
+    log_file_info = max(log_files, key=attrgetter('cdt'), default=None)
     if not log_file_info:
         app.logger.info(f'There are no log files in log directory {cfg.Logs.DIR} with specified prefix {cfg.Logs.FILE_NAME_PREFIX} and dt format {cfg.Logs.FILE_NAME_DATE_FORMAT}.')
         return 1
     app.logger.debug(log_file_info)
 
-    # check report file for existence
-    report_file_path = generate_report_file_name(cfg.Report, log_file_info)
-    if report_file_path.exists():
-        app.logger.info(f'Report file [{report_file_path}] has been already created earlier.')
+    # check report (or partial statistics) file for existence (in incremental mode report is regenerated)
+    report_file_path = generate_report_file_name(cfg.Report, log_file_info, app)
+    if (output_path := partial_file_path(report_file_path) if app.is_on(cfg.Report.PARTIAL) else report_file_path).exists() and not app.is_on(cfg.Logs.INCREMENTAL):
+        app.logger.info(f'Report file [{output_path}] has been already created earlier.')
         return 2
     app.logger.debug(report_file_path)
+    return process_log(log_file_info, report_file_path, app)
 
-    # parse logs
-    log_line_count = 0
-    total_request_time = 0
-    mismatched_line_numbers = []
-    stat_requests = cs.defaultdict(list)
-    log_line_parser = re.compile(cfg.Logs.LINE_FORMAT, re.IGNORECASE)
-    for log_line_count, log_line in enumerate(log_lines(log_file_info)):
-        # Log line example:
-        # '1.196.116.32 -  - [29/Jun/2017:03:50:22 +0300] "GET /api/v2/banner/25019354 HTTP/1.1" 200 927 "-" "Lynx/2.8.8dev.9 libwww-FM/2.14 SSL-MM/1.4.1 GNUTLS/2.10.5" "-" "1498697422-2190034393-4708-9752759" "dc7161be3" 0.390\n'
-        if request_info := get_request_info(log_line, log_line_parser):
-            total_request_time += request_info.time
-            stat_requests[request_info.uri].append(request_info.time)
-        else:
-            mismatched_line_numbers.append(log_line_count)
-    if mismatched_line_numbers:
-        app.logger.debug(f'Mismatched line numbers in log file {log_file_info.path}:\n{" ".join(map(str,mismatched_line_numbers))}')
-    if cfg.Logs.UNMATCHED_LINE_LIMIT and (float(cfg.Logs.UNMATCHED_LINE_LIMIT) < len(mismatched_line_numbers) / log_line_count):
-        app.logger.error(f'Mismatch limit has been exceeded. Parsing errors count = {len(mismatched_line_numbers)}.')
+
+def backfill(app=App) -> int:
+    """
+    Make reports for every log in Logs.DIR which has no report yet. Logs are processed by pool of Logs.BACKFILL_WORKERS processes.
+
+    Args:
+        App: application settings class
+
+    Returns:
+        -1 - processing of some log is failed (see per-file summary in log)
+        0 - ok
+        1 - no logs
+        2 - all reports exist
+    """
+    cfg = app.cfg
+    log_files = log_files_info(cfg.Logs, app)  # directory is scanned once
+    if not log_files:
+        app.logger.info(f'There are no log files in log directory {cfg.Logs.DIR} with specified prefix {cfg.Logs.FILE_NAME_PREFIX} and dt format {cfg.Logs.FILE_NAME_DATE_FORMAT}.')
+        return 1
+    reports = {}  # report file path -> the first found log of its date
+    for log_file_info in log_files:
+        reports.setdefault(generate_report_file_name(cfg.Report, log_file_info, app), log_file_info)
+    partial = app.is_on(cfg.Report.PARTIAL)
+    reports = dict((report_file_path, log_file_info) for report_file_path, log_file_info in reports.items() if not (partial_file_path(report_file_path) if partial else report_file_path).exists())
+    if not reports:
+        app.logger.info(f'Reports of all log files in log directory {cfg.Logs.DIR} have been already created earlier.')
+        return 2
+
+    # every log is parsed serially by one of workers, metrics of logs are combined and saved to Metrics.FILE by this process
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    config = app.merge_config({'Logs': {'WORKERS': '1'}, 'Metrics': {'FILE': None}}, app.config)
+    statuses = {}
+    with ProcessPoolExecutor(max_workers=min(int(cfg.Logs.BACKFILL_WORKERS or 1) or os.cpu_count(), len(reports))) as executor:
+        futures = dict((executor.submit(process_log_task, config, log_file_info, report_file_path), log_file_info) for report_file_path, log_file_info in reports.items())
+        for future in as_completed(futures):
+            try:
+                result, metrics = future.result()
+                statuses[futures[future]] = {0: 'ok', -1: 'failed'}.get(result, 'failed')
+                app.metrics.merge(metrics)
+            except Exception as exc:
+                app.logger.error(f'Processing of log file {futures[future].path} is failed: {exc!r}')
+                statuses[futures[future]] = 'failed'
+    summary = "\n".join(f'{log_file_info.path}: {status}' for log_file_info, status in sorted(statuses.items(), key=lambda item: item[0].cdt))
+    app.logger.info(f'Backfill summary ({len(statuses)} logs, {list(statuses.values()).count("failed")} failed):\n{summary}')
+    report_metrics(app)
+    return -1 if 'failed' in statuses.values() else 0
+
+
+def process_log_task(config: dict, log_file_info: FileInfo, report_file_path: Path) -> tuple:
+    """Worker task: make report [report_file_path] of log file [log_file_info] using app [config] settings. Return (result of process_log, Metrics of log)."""
+    App.configure(config)
+    return process_log(log_file_info, report_file_path, App), App.metrics
+
+
+def process_log(log_file_info: FileInfo, report_file_path: Path, app=App) -> int:
+    """
+    Parse log file [log_file_info] and save its report to [report_file_path] (or partial statistics file if Report.PARTIAL is on).
+
+    Returns:
+        -1 - mismatch limit has been exceeded (by sampled lines, parsed part of log or the whole log)
+        0 - ok
+    """
+    cfg = app.cfg
+    incremental = app.is_on(cfg.Logs.INCREMENTAL)
+    try:
+        with profiling(report_file_path, app) if app.is_on(cfg.Metrics.PROFILE) else nullcontext():
+            # check sampled lines and parse logs
+            if not validate_log_format(log_file_info, app):
+                return -1
+            # log is parsed up to its size taken before parsing, so key of cached statistics (see cache_key) has the parsed end
+            # and cache of log changed since then is stale
+            fingerprint = log_fingerprint(log_file_info)
+            try:
+                if incremental:
+                    stats = parse_log_incrementally(log_file_info, checkpoint_file_path(report_file_path), app, fingerprint)
+                else:
+                    stats = parse_log(log_file_info, app, end=fingerprint['size'])
+            except MismatchLimitError as exc:
+                app.logger.error(f'Parsing of log file {log_file_info.path} is aborted. {exc}')
+                return -1
+            return save_stats(stats, log_file_info, report_file_path, app, fingerprint)
+    finally:
+        report_metrics(app)
+
+
+def save_stats(stats: LogStats, log_file_info: FileInfo, report_file_path: Path, app=App, fingerprint: dict = None) -> int:
+    """
+    Save report of statistics [stats] of log file [log_file_info] to [report_file_path] (or partial statistics file if Report.PARTIAL is on).
+
+    If [fingerprint] of parsed log (see log_fingerprint) is given and Report.CACHE is on, then statistics are also cached for rollup command (see write_cache).
+
+    Returns:
+        -1 - mismatch limit has been exceeded
+        0 - ok
+    """
+    app.metrics.totals.update(lines=stats.line_count, mismatches=stats.mismatch_count)
+    if stats.mismatch_samples:
+        app.logger.debug(f'Examples of mismatched lines in log file {log_file_info.path} ({stats.mismatch_count} mismatched):\n{format_mismatch_samples(stats.samples())}')
+    if not check_mismatch_limit(stats, app):
+        return -1
+    if fingerprint and app.is_on(app.cfg.Report.CACHE):
+        write_cache(stats, log_file_info, fingerprint, app)
+    if app.is_on(app.cfg.Report.PARTIAL):
+        with app.metrics.stage('partial'):
+            write_partial(partial_file_path(report_file_path), stats, {'log': str(log_file_info.path), 'date': log_file_info.cdt.isoformat()}, app)
+        app.logger.info(f'Partial statistics have been successfully saved to file: {str(partial_file_path(report_file_path))}')
+        return 0
+    save_report(stats, report_file_path, app)
+    return 0
+
+
+def merge_partials(partial_paths: list, report_file_path: Path = None, app=App) -> int:
+    """
+    Merge partial statistics files [partial_paths] (e.g. made on several hosts) and save report to [report_file_path].
+
+    If [report_file_path] is None, then report file name is generated by the date of partials (which should be the same).
+    Headers of all files are checked before merging: partials made with different statistics settings (see partial_settings) aren't merged.
+
+    Returns:
+        -1 - some file isn't a partial statistics one, partials have different settings, mismatch limit has been exceeded or report file name can't be generated
+        0 - ok
+    """
+    cfg = app.cfg
+    stats, dates = None, set()
+    with app.metrics.stage('merge') as stage:
+        headers = {}
+        for partial_path in partial_paths:
+            try:
+                headers[str(partial_path)] = read_partial_header(Path(partial_path))
+            except (OSError, ValueError, struct.error, zlib.error) as exc:
+                app.logger.error(f'Partial statistics file [{partial_path}] can"t be loaded: {exc}')
+                return -1
+        if differences := settings_differences(headers):
+            app.logger.error(f'Partial statistics files have been made with different settings, so they can"t be merged: {"; ".join(differences)}.')
+            return -1
+        for partial_path in partial_paths:
+            try:
+                partial_stats, header = read_partial(Path(partial_path))
+            except (OSError, ValueError, struct.error, zlib.error) as exc:
+                app.logger.error(f'Partial statistics file [{partial_path}] can"t be loaded: {exc}')
+                return -1
+            app.logger.debug(f'Partial statistics file [{partial_path}]: host {header["host"]}, log {header.get("log")}, {header["line_count"]} lines.')
+            dates.add(header.get('date'))
+            stats = partial_stats if stats is None else stats.merge(partial_stats)
+            stage.items += 1
+            stage.bytes += Path(partial_path).stat().st_size
+    app.metrics.totals.update(lines=stats.line_count, mismatches=stats.mismatch_count)
+    if report_file_path is None:
+        if len(dates) != 1 or None in dates:
+            app.logger.error(f'Partial statistics files have different dates {sorted(map(str, dates))}, so report file should be specified.')
+            return -1
+        report_file_path = generate_report_file_name(cfg.Report, FileInfo(None, datetime.fromisoformat(dates.pop()), None), app)
+    if not check_mismatch_limit(stats, app):
+        return -1
+    save_report(stats, report_file_path, app)
+    report_metrics(app)
+    return 0
+
+
+def rollup_report_file_name(report_cfg, date_from: datetime, date_to: datetime, app=App) -> Path:
+    """Return path of rollup report of logs from [date_from] to [date_to]: Report.DIR / FILE_NAME_PREFIX + both dates in FILE_NAME_DATE_FORMAT joined by '-' + ext (see report_file_ext)."""
+    report_path = app.resolve_path(report_cfg.DIR)
+    report_path.mkdir(parents=True, exist_ok=True)
+    dates = f'{date_from.strftime(report_cfg.FILE_NAME_DATE_FORMAT)}-{date_to.strftime(report_cfg.FILE_NAME_DATE_FORMAT)}'
+    return report_path.joinpath(f'{report_cfg.FILE_NAME_PREFIX}{dates}{report_file_ext(report_formats(report_cfg)[0], report_cfg)}')
+
+
+def rollup(date_from: datetime, date_to: datetime = None, report_file_path: Path = None, app=App) -> int:
+    """
+    Make report of logs from [date_from] to [date_to] (inclusive, None - up to the latest log) by merging their cached statistics (see write_cache).
+
+    Only logs without fresh cache (missing one, made of another log content or with other statistics settings, see is_cache_fresh) are parsed and cached:
+    the only one - in this process (with Logs.WORKERS), several ones - by pool of Logs.BACKFILL_WORKERS processes (every log is parsed serially).
+    Cached statistics of dates whose logs have been already removed are merged too (if they have the same settings).
+    If [report_file_path] is None, then report file name is generated by the dates of range (see rollup_report_file_name).
+
+    Returns:
+        -1 - parsing of some log is failed (see per-date summary in log) or mismatch limit has been exceeded
+        0 - ok
+        1 - no logs (and cached statistics) in range
+    """
+    cfg = app.cfg
+    with app.metrics.stage('scan') as stage:
+        log_files = log_files_info(cfg.Logs, app)
+        stage.items += len(log_files)
+    date_to = date_to or max((log_file_info.cdt for log_file_info in log_files), default=date_from)
+    logs = {}  # date -> the first found log of this date
+    for log_file_info in log_files:
+        if date_from <= log_file_info.cdt <= date_to:
+            logs.setdefault(log_file_info.cdt, log_file_info)
+    caches, statuses = {}, {}  # date -> cached statistics file, status
+    for cdt, log_file_info in logs.items():
+        cache_path = cache_file_path(cfg.Report, log_file_info, app)
+        if is_cache_fresh(load_cache_header(cache_path, app), cache_key(log_file_info, log_fingerprint(log_file_info), app)):
+            caches[cdt], statuses[cdt] = cache_path, 'cached'
+    cache_dir, settings = app.resolve_path(cfg.Report.DIR) / CACHE_DIR_NAME, stats_settings(cfg)
+    for cache_path in cache_dir.iterdir() if cache_dir.is_dir() else []:
+        if cache_path.name.startswith(cfg.Report.FILE_NAME_PREFIX) and cache_path.name.endswith(PARTIAL_FILE_EXT) and (header := load_cache_header(cache_path, app)):
+            if header.get('settings') == settings and date_from <= (cdt := datetime.fromisoformat(header['date'])) <= date_to and cdt not in logs:
+                caches[cdt], statuses[cdt] = cache_path, 'cached (log is removed)'
+
+    # logs without fresh cache are parsed
+    stale = dict((cdt, log_file_info) for cdt, log_file_info in logs.items() if cdt not in caches)
+    if len(stale) == 1:
+        cdt, log_file_info = stale.popitem()
+        statuses[cdt] = 'parsed' if cache_log(log_file_info, app) == 0 else 'failed'
+    elif stale:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        config = app.merge_config({'Logs': {'WORKERS': '1'}}, app.config)
+        with ProcessPoolExecutor(max_workers=min(int(cfg.Logs.BACKFILL_WORKERS or 1) or os.cpu_count(), len(stale))) as executor:
+            futures = dict((executor.submit(cache_log_task, config, log_file_info), cdt) for cdt, log_file_info in stale.items())
+            for future in as_completed(futures):
+                try:
+                    statuses[futures[future]] = 'parsed' if future.result() == 0 else 'failed'
+                except Exception as exc:
+                    app.logger.error(f'Processing of log file {stale[futures[future]].path} is failed: {exc!r}')
+                    statuses[futures[future]] = 'failed'
+    for cdt, log_file_info in logs.items():
+        if statuses[cdt] == 'parsed':
+            caches[cdt] = cache_file_path(cfg.Report, log_file_info, app)
+    if not caches:
+        app.logger.info(f'There are no log files (and cached statistics) from {date_from.date()} to {date_to.date()} in log directory {cfg.Logs.DIR}.')
+        return 1 if not statuses else -1
+
+    # cached statistics are merged in order of dates
+    stats = None
+    with app.metrics.stage('merge') as stage:
+        for cdt in sorted(caches):
+            cached_stats, _ = read_partial(caches[cdt])
+            stats = cached_stats if stats is None else stats.merge(cached_stats)
+            stage.items += 1
+            stage.bytes += caches[cdt].stat().st_size
+    summary = "\n".join(f'{cdt.date()}: {status}' for cdt, status in sorted(statuses.items()))
+    app.logger.info(f'Rollup summary ({len(statuses)} dates, {list(statuses.values()).count("parsed")} parsed, {list(statuses.values()).count("failed")} failed):\n{summary}')
+    app.metrics.totals.update(lines=stats.line_count, mismatches=stats.mismatch_count)
+    if not check_mismatch_limit(stats, app):
         return -1
+    save_report(stats, report_file_path or rollup_report_file_name(cfg.Report, date_from, date_to, app), app)
+    report_metrics(app)
+    return -1 if 'failed' in statuses.values() else 0
+
+
+def cache_log_task(config: dict, log_file_info: FileInfo) -> int:
+    """Worker task: parse log file [log_file_info] and cache its statistics using app [config] settings."""
+    App.configure(config)
+    return cache_log(log_file_info, App)
+
 
-    # prepare parsed logs statistics
-    list_requests = []
-    for url, times in stat_requests.items():
-        times_sum = sum(times)
-        times_count = len(times)
-        list_requests.append({
+def cache_log(log_file_info: FileInfo, app=App) -> int:
+    """
+    Parse log file [log_file_info] up to its size in fingerprint (see cache_key) and cache its statistics (see write_cache).
+
+    Returns:
+        -1 - mismatch limit has been exceeded (by sampled lines, parsed part of log or the whole log)
+        0 - ok
+    """
+    if not validate_log_format(log_file_info, app):
+        return -1
+    fingerprint = log_fingerprint(log_file_info)
+    try:
+        stats = parse_log(log_file_info, app, end=fingerprint['size'])
+    except MismatchLimitError as exc:
+        app.logger.error(f'Parsing of log file {log_file_info.path} is aborted. {exc}')
+        return -1
+    if not check_mismatch_limit(stats, app):
+        return -1
+    write_cache(stats, log_file_info, fingerprint, app)
+    return 0
+
+
+def check_mismatch_limit(stats: LogStats, app=App) -> bool:
+    """Return false (and log error) if share of mismatched lines of [stats] exceeds Logs.UNMATCHED_LINE_LIMIT."""
+    limit = app.cfg.Logs.UNMATCHED_LINE_LIMIT
+    if limit and stats.line_count and (float(limit) < stats.mismatch_count / stats.line_count):
+        app.logger.error(f'Mismatch limit has been exceeded. Parsing errors count = {stats.mismatch_count}.')
+        return False
+    return True
+
+
+def save_report(stats: LogStats, report_file_path: Path, app=App) -> None:
+    """
+    Save report of [stats] to [report_file_path] (and next to it in the other formats of Report.FORMATS, see report_file_paths).
+
+    Tables of dimensions (see Stats.DIMENSIONS) are embedded to template report ($dimensions_json), other formats get separate files (see dimension_file_path).
+    """
+    cfg = app.cfg
+    percentiles = [percentile.strip() for percentile in (cfg.Stats.PERCENTILES or '').split(',') if percentile.strip()]
+    quantiles = [0.5] + [float(percentile) / 100 for percentile in percentiles]
+    with app.metrics.stage('summary') as stage:
+        # take first Report.REPORT_SIZE urls sorted by $time_sum desc
+        url_summaries = stats.requests.summary(quantiles, int(cfg.Report.REPORT_SIZE) if cfg.Report.REPORT_SIZE else None)
+        stage.items += len(url_summaries)
+        # all keys of dimensions sorted by $time_sum desc, time buckets in time order
+        dimension_rows = {}
+        for dimension, key in stats.dimension_keys:
+            summaries = stats.dimensions[dimension].summary(quantiles)
+            dimension_rows[dimension] = list(report_rows(stats, sorted(summaries, key=attrgetter('url')) if key.is_time else summaries, percentiles, app, dimension))
+            stage.items += len(summaries)
+    columns = ['count', 'time_sum', 'count_perc', 'time_perc', 'time_avg', 'time_max', 'time_med', *(f'time_p{percentile}' for percentile in percentiles), 'url']
+    for report_format, path in report_file_paths(report_file_path, app).items():
+        with app.metrics.stage('write') as stage:
+            with open_report(path, app) as report_file:
+                REPORT_WRITERS[report_format](report_rows(stats, url_summaries, percentiles, app), columns, report_file, app, dimension_rows)
+            stage.items += len(url_summaries)
+            stage.bytes += path.stat().st_size
+        app.logger.info(f'Report has been successfully created and saved to file: {str(path)}')
+        if report_format == 'template':
+            continue
+        for dimension, rows in dimension_rows.items():
+            dimension_path = dimension_file_path(path, report_format, dimension, app)
+            with app.metrics.stage('write') as stage:
+                with open_report(dimension_path, app) as report_file:
+                    REPORT_WRITERS[report_format](iter(rows), columns[:-1] + [dimension], report_file, app)
+                stage.items += len(rows)
+                stage.bytes += dimension_path.stat().st_size
+            app.logger.info(f'Report of {dimension} has been successfully created and saved to file: {str(dimension_path)}')
+
+
+def report_rows(stats: LogStats, url_summaries: list, percentiles: list, app=App, key_column: str = 'url'):
+    """Return generator of report rows (dicts) of [url_summaries] (UrlSummary with quantiles: median and [percentiles]) of [stats], url (key) is in [key_column]."""
+    log_line_count, total_request_time, mismatch_count = stats.line_count, stats.total_time, stats.mismatch_count
+    for url_summary in url_summaries:
+        times_sum = url_summary.total
+        times_count = url_summary.count
+        yield {
             'count': times_count,   # count - сколько раз встречается URL, абсолютное значение
             'time_sum': round(times_sum, app.ROUND_NDIGITS),  # time_sum - суммарный $request_time для данного URL'а, абсолютное значение
-            'count_perc': round(100 * times_count / (log_line_count - len(mismatched_line_numbers)), app.ROUND_NDIGITS),    # count_perc - сколько раз встречается URL, в процентнах относительно общего числа запросов
+            'count_perc': round(100 * times_count / (log_line_count - mismatch_count), app.ROUND_NDIGITS),    # count_perc - сколько раз встречается URL, в процентнах относительно общего числа запросов
             'time_perc': round(100 * times_sum / total_request_time, app.ROUND_NDIGITS),    # time_perc - суммарный $request_time для данного URL'а, в процентах относительно общего $request_time всех запросов
             'time_avg': round(times_sum / times_count, app.ROUND_NDIGITS),    # time_avg - средний $request_time для данного URL'а
-            'time_max': max(times),  # time_max - максимальный $request_time для данного URL'а
-            'time_med': round(median(times), app.ROUND_NDIGITS),  # time_med - медиана $request_time для данного URL'а
-            'url': url,
-            })
+            'time_max': url_summary.max,  # time_max - максимальный $request_time для данного URL'а
+            'time_med': round(url_summary.quantiles[0], app.ROUND_NDIGITS),  # time_med - медиана $request_time для данного URL'а
+            **{f'time_p{percentile}': round(quantile, app.ROUND_NDIGITS) for percentile, quantile in zip(percentiles, url_summary.quantiles[1:])},  # time_p<N> - N-й процентиль $request_time
+            key_column: url_summary.url,  # url - URL (или ключ измерения: статус, метод, интервал времени)
+            }
+
+
+@contextmanager
+def open_report(report_file_path: Path, app=App):
+    """Open report file [report_file_path] for writing text (gzip compressed if its ext is .gz), file is replaced atomically when writing is complete."""
+    temp_path = report_file_path.with_name(f'{report_file_path.name}.tmp')
+    with (gzip.open if report_file_path.suffix == '.gz' else open)(temp_path, 'wt', encoding=app.ENCONDING) as report_file:
+        yield report_file
+    os.replace(temp_path, report_file_path)
+
+
+def write_chunks(report_file, parts, chunk_size: int) -> None:
+    """Write text [parts] to [report_file] by chunks of [chunk_size] parts."""
+    while chunk := ''.join(islice(parts, chunk_size)):
+        report_file.write(chunk)
+
+
+def write_template_report(rows, columns: list, report_file, app=App, dimensions: dict = None) -> None:
+    """
+    Write report [rows] to [report_file] by Report.TEMPLATE_FILE_PATH template: $table_json is replaced with JSON array of rows streamed by chunks,
+    $dimensions_json - with JSON object of rows of [dimensions] tables {dimension: [row, ...]}.
+    """
+    with open(app.cfg.Report.TEMPLATE_FILE_PATH, 'rt', encoding=app.ENCONDING) as report_template_file:
+        template = report_template_file.read()
+    # split template by the first $table_json placeholder (parts are substituted as a whole template would be, e.g. $$ -> $)
+    head, tail = template, None
+    for match in Template.pattern.finditer(template):
+        if (match.group('named') or match.group('braced')) == 'table_json':
+            head, tail = template[:match.start()], template[match.end():]
+            break
+    dimensions_json = json.dumps(dimensions or {})
+    report_file.write(Template(head).safe_substitute(dimensions_json=dimensions_json))
+    if tail is not None:
+        # the same text as json.dumps(list(rows))
+        report_file.write('[')
+        write_chunks(report_file, (f'{", " if i else ""}{json.dumps(row)}' for i, row in enumerate(rows)), app.WRITE_ROWS)
+        report_file.write(']')
+        report_file.write(Template(tail).safe_substitute(dimensions_json=dimensions_json))
+
+
+def write_csv_report(rows, columns: list, report_file, app=App, dimensions: dict = None) -> None:
+    """Write report [rows] to [report_file] in CSV format with header of [columns] ([dimensions] tables are saved to separate files by save_report)."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, columns, lineterminator='\n')
+    writer.writeheader()
+    for chunk in iter(lambda: list(islice(rows, app.WRITE_ROWS)), []):
+        writer.writerows(chunk)
+        report_file.write(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+    report_file.write(buffer.getvalue())
+
+
+def write_jsonl_report(rows, columns: list, report_file, app=App, dimensions: dict = None) -> None:
+    """Write report [rows] to [report_file] in JSON Lines format (JSON object of row per line, [dimensions] tables are saved to separate files by save_report)."""
+    write_chunks(report_file, (f'{json.dumps(row)}\n' for row in rows), app.WRITE_ROWS)
 
-    # sort by $time_sum desc and take first Report.REPORT_SIZE records
-    list_requests = sorted(list_requests, key=itemgetter('time_sum'), reverse=True)[:int(cfg.Report.REPORT_SIZE)]
 
-    # open report template and read content
-    report_content = ""
-    with open(cfg.Report.TEMPLATE_FILE_PATH, 'rt', encoding=app.ENCONDING) as report_template_file:
-        report_content = report_template_file.read()
-    report_content = Template(report_content).safe_substitute(table_json=json.dumps(list_requests))
+REPORT_WRITERS = {'template': write_template_report, 'csv': write_csv_report, 'jsonl': write_jsonl_report}
 
-    # save fullfilled template content to report file
-    with open(report_file_path, 'wt', encoding=app.ENCONDING) as report_file:
-        report_file.write(report_content)
 
-    app.logger.info(f'Report has been successfully created and saved to file: {str(report_file_path)}')
+def report_metrics(app=App) -> None:
+    """Log metrics of log processing (App.metrics) and save them to Metrics.FILE if it is set."""
+    app.metrics.log(app.logger)
+    if app.cfg.Metrics.FILE:
+        metrics_path = app.resolve_path(app.cfg.Metrics.FILE)
+        app.metrics.save(metrics_path)
+        app.logger.debug(f'Metrics have been saved to file: {str(metrics_path)}')
+
+
+@contextmanager
+def profiling(report_file_path: Path, app=App):
+    """
+    Profile block by cProfile and tracemalloc (in current process only), save results next to report [report_file_path].
+
+    Files: <report>.prof - cProfile stats (see pstats module), <report>.prof.txt - the most expensive functions and memory allocations.
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot, (_, memory_peak) = tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profile_path = report_file_path.with_name(f'{report_file_path.name}.prof')
+        profiler.dump_stats(str(profile_path))
+        with open(profile_path.with_name(f'{profile_path.name}.txt'), 'wt', encoding=app.ENCONDING) as profile_file:
+            pstats.Stats(profiler, stream=profile_file).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+            profile_file.write(f'Memory peak (traced by tracemalloc): {memory_peak} bytes\nTop memory allocations:\n')
+            profile_file.writelines(f'{statistic}\n' for statistic in snapshot.statistics('lineno')[:50])
+        app.logger.info(f'Profile has been saved to files: {str(profile_path)}, {str(profile_path)}.txt')
+
+
+class Watcher:
+    """
+    class Watcher - keeps report of the latest log in Logs.DIR up to date in watch mode (see watch).
+
+    Config, compiled parser and statistics stay in memory between polls: new complete lines of growing plain log are parsed
+    from the last offset and merged into statistics, compressed log is parsed when it appears or changes,
+    rotated (truncated) log or log of a newer date is parsed from the beginning. Report is saved after every poll with new lines.
+    Before log of a newer date is watched, the rest of the previous one is parsed and its report is saved (see finish).
+    """
+
+    CONTENT_TYPES = {'.html': 'text/html', '.csv': 'text/csv', '.jsonl': 'application/x-ndjson', '.json': 'application/json'}
+
+    def __init__(self, app=App, executor=None):
+        """Make watcher of app [app] with pool of parser processes [executor] (None - new pool per parsing if Logs.WORKERS isn't 1)."""
+        self.app = app
+        self.executor = executor
+        self.log_file_info = None  # watched log
+        self.report_file_path = None
+        self.stats = None  # statistics of parsed part of log
+        self.fingerprint = None  # log identity when it has been parsed last time (see log_fingerprint)
+        self.offset = 0  # parsed bytes of plain log, size of parsed compressed log
+        self.rejected = False  # log has been rejected due to mismatch limit, so it is skipped until it is rotated
+        self.polls = 0
+        self.updated = None  # time of the last update of report
+        self.metrics = (app.metrics.to_prometheus(), json.dumps(self.status()))  # snapshot of metrics served by HTTP
+
+    def status(self) -> dict:
+        """Return status of watcher with metrics summary."""
+        return dict(self.app.metrics.summary(), watch={'log': str(self.log_file_info.path) if self.log_file_info else None, 'offset': self.offset,
+                                                       'lines': self.stats.line_count if self.stats else 0, 'polls': self.polls, 'updated': self.updated})
+
+    def poll(self) -> bool:
+        """Parse new lines of the latest log in Logs.DIR and save its report. Return true if report has been updated."""
+        app = self.app
+        cfg = app.cfg
+        self.polls += 1
+        try:
+            with app.metrics.stage('scan') as stage:
+                log_files = log_files_info(cfg.Logs, app)
+                stage.items += len(log_files)
+            if not (log_file_info := max(log_files, key=attrgetter('cdt'), default=None)):
+                return False
+            fingerprint = log_fingerprint(log_file_info)
+            if log_file_info != self.log_file_info or (reason := log_discontinuity(log_file_info, self.fingerprint, self.offset, fingerprint)):
+                if self.log_file_info and log_file_info != self.log_file_info:
+                    self.finish()
+                if self.log_file_info:
+                    app.logger.info(f'Log file {log_file_info.path} is parsed from the beginning: '
+                                    f'{"log of another date has appeared" if log_file_info != self.log_file_info else f"it has been {reason}"}.')
+                if not validate_log_format(log_file_info, app):
+                    return False
+                self.log_file_info, self.report_file_path = log_file_info, generate_report_file_name(cfg.Report, log_file_info, app)
+                self.stats, self.fingerprint, self.offset, self.rejected = LogStats.from_cfg(cfg), fingerprint, 0, False
+            if self.rejected:
+                return False
+            end = fingerprint['size'] if is_compressed(log_file_info) else complete_lines_end(log_file_info, fingerprint['size'])
+            if end <= self.offset:
+                return False
+            try:
+                # compressed log is parsed entirely, its offset is 0 here
+                self.stats.merge(parse_log(log_file_info, app, self.offset, end, self.executor))
+            except MismatchLimitError as exc:
+                app.logger.error(f'Parsing of log file {log_file_info.path} is aborted, it is skipped until rotation. {exc}')
+                self.rejected = True
+                return False
+            self.fingerprint, self.offset = fingerprint, end
+            # cache is fresh while size of log is the parsed one (see is_cache_fresh)
+            if save_stats(self.stats, log_file_info, self.report_file_path, app, dict(fingerprint, size=end)) != 0:
+                return False
+            self.updated = datetime.now().isoformat(timespec='seconds')
+            if cfg.Metrics.FILE:
+                app.metrics.save(app.resolve_path(cfg.Metrics.FILE))
+            return True
+        finally:
+            self.metrics = (app.metrics.to_prometheus(), json.dumps(self.status()))
+
+    def finish(self) -> None:
+        """Parse the rest of the watched log (lines appended since the last poll and the last line without line break) and save its report before another log is watched."""
+        app, log_file_info = self.app, self.log_file_info
+        if self.rejected or is_compressed(log_file_info) or not log_file_info.path.exists():
+            return
+        fingerprint = log_fingerprint(log_file_info)
+        if log_discontinuity(log_file_info, self.fingerprint, self.offset, fingerprint) or fingerprint['size'] <= self.offset:
+            return
+        try:
+            self.stats.merge(parse_log(log_file_info, app, self.offset, fingerprint['size'], self.executor))
+        except MismatchLimitError as exc:
+            app.logger.error(f'Parsing of log file {log_file_info.path} is aborted. {exc}')
+            self.rejected = True
+            return
+        self.fingerprint, self.offset = fingerprint, fingerprint['size']
+        if save_stats(self.stats, log_file_info, self.report_file_path, app, fingerprint) == 0:
+            app.logger.debug(f'Report of log file {log_file_info.path} has been finished: {self.stats.line_count} lines.')
+
+    def response(self, path: str) -> tuple:
+        """
+        Return HTTP response (status, headers dict, body bytes) to GET request of [path].
+
+        Paths: / and /report - report file (of the first format of Report.FORMATS), /report.<format> - report file in another format,
+        /metrics - metrics in Prometheus text format, /metrics.json - metrics and status of watcher in JSON.
+        """
+        path = path.split('?', 1)[0]
+        if path == '/metrics':
+            return 200, {'Content-Type': 'text/plain; version=0.0.4'}, self.metrics[0].encode()
+        if path == '/metrics.json':
+            return 200, {'Content-Type': 'application/json'}, self.metrics[1].encode()
+        if path not in ('/', '/report') and not path.startswith('/report.'):
+            return 404, {'Content-Type': 'text/plain'}, b'Not found\n'
+        report_paths = report_file_paths(self.report_file_path, self.app) if self.report_file_path and not self.app.is_on(self.app.cfg.Report.PARTIAL) else {}
+        report_path = next(iter(report_paths.values()), None) if path in ('/', '/report') else report_paths.get(path[len('/report.'):])
+        if report_path is None or not report_path.exists():
+            return 404, {'Content-Type': 'text/plain'}, b'Report is not available\n'
+        headers = {'Content-Type': self.CONTENT_TYPES.get(Path(report_path.name.removesuffix('.gz')).suffix, 'text/plain') + f'; charset={self.app.ENCONDING}'}
+        if report_path.suffix == '.gz':
+            headers['Content-Encoding'] = 'gzip'
+        return 200, headers, report_path.read_bytes()
+
+
+async def serve_http(watcher: Watcher, reader, writer) -> None:
+    """Serve HTTP request read by [reader] stream with response of [watcher] written to [writer] stream (GET and HEAD methods only)."""
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        while (await reader.readline()).strip():
+            pass  # headers are not used
+        if len(request_line) != 3:
+            status, headers, body = 400, {'Content-Type': 'text/plain'}, b'Bad request\n'
+        elif request_line[0] not in ('GET', 'HEAD'):
+            status, headers, body = 405, {'Content-Type': 'text/plain', 'Allow': 'GET, HEAD'}, b'Method not allowed\n'
+        else:
+            status, headers, body = watcher.response(request_line[1])
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+        head = ''.join(f'{name}: {value}\r\n' for name, value in dict(headers, **{'Content-Length': len(body), 'Connection': 'close'}).items())
+        writer.write(f'HTTP/1.1 {status} {reasons[status]}\r\n{head}\r\n'.encode('latin-1'))
+        if request_line[:1] != ['HEAD']:
+            writer.write(body)
+        await writer.drain()
+    except (ConnectionError, UnicodeDecodeError):
+        pass
+    finally:
+        writer.close()
+
+
+async def watch(app=App, stop=None) -> int:
+    """
+    Watch mode: poll Logs.DIR every Watch.INTERVAL seconds and keep report of the latest log up to date (see Watcher) until [stop] event is set (or SIGINT, SIGTERM).
+
+    Parsing runs in a thread (and pool of Logs.WORKERS processes kept between polls), so report and metrics are served by HTTP
+    on Watch.HOST:Watch.PORT (if it is set) meanwhile. If [stop] is already set, then Logs.DIR is polled once.
+    """
+    import asyncio
+    import signal
+    cfg = app.cfg
+    loop = asyncio.get_running_loop()
+    stop = stop or asyncio.Event()
+    signals = []
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError, RuntimeError, ValueError):  # not supported on windows or not in main thread
+            loop.add_signal_handler(signal_number, stop.set)
+            signals.append(signal_number)
+    executor, server = None, None
+    if (workers := int(cfg.Logs.WORKERS or 1) or os.cpu_count()) != 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=workers)
+    watcher = Watcher(app, executor)
+    try:
+        if cfg.Watch.PORT:
+            server = await asyncio.start_server(partial(serve_http, watcher), cfg.Watch.HOST, int(cfg.Watch.PORT))
+            app.logger.info(f'Report and metrics are served on http://{":".join(map(str, server.sockets[0].getsockname()[:2]))}/')
+        while True:
+            try:
+                if await loop.run_in_executor(None, watcher.poll):
+                    app.logger.debug(f'Report of log file {watcher.log_file_info.path} has been updated: {watcher.stats.line_count} lines.')
+            except Exception:
+                app.logger.exception(f'Polling of log directory {cfg.Logs.DIR} is failed.')
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), float(cfg.Watch.INTERVAL))
+            if stop.is_set():
+                break
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+        if watcher.executor is not None:
+            watcher.executor.shutdown()
+        for signal_number in signals:
+            loop.remove_signal_handler(signal_number)
+    app.logger.info('Watch mode has been stopped.')
     return 0
 
 
 if __name__ == "__main__":
+    from docopt import docopt, DocoptExit  # https://pypi.org/project/docopt/
     try:
         args = docopt(__doc__, version=__version__)
         if args["-i"]:
@@ -374,9 +2586,42 @@ if __name__ == "__main__":
             import doctest
             doctest.testmod(optionflags=doctest.NORMALIZE_WHITESPACE)
         else:
-            App.init(args["--config"])
-            main(App)
+            overrides = cs.defaultdict(dict)
+            if args["--workers"] is not None:
+                overrides['Logs']['WORKERS'] = args["--workers"]
+            if args["--incremental"]:
+                overrides['Logs']['INCREMENTAL'] = 'yes'
+            if args["--partial"]:
+                overrides['Report']['PARTIAL'] = 'yes'
+            if args["--profile"]:
+                overrides['Metrics']['PROFILE'] = 'yes'
+            if args["--interval"] is not None:
+                overrides['Watch']['INTERVAL'] = args["--interval"]
+            if args["--port"] is not None:
+                overrides['Watch']['PORT'] = args["--port"]
+            App.init(args["--config"], overrides)
+            if args["merge"]:
+                sys.exit(merge_partials(args["<partial>"], Path(args["--output"]) if args["--output"] else None, App))
+            if args["rollup"]:
+                date_format = App.cfg.Logs.FILE_NAME_DATE_FORMAT
+                try:
+                    date_from, date_to = (datetime.strptime(args[name], date_format) if args[name] else None for name in ("<date_from>", "<date_to>"))
+                except ValueError:
+                    App.logger.error(f'Dates of rollup command should be in Logs.FILE_NAME_DATE_FORMAT ({date_format}): {args["<date_from>"]} {args["<date_to>"] or ""}.\n{__doc__}')
+                    sys.exit(-1)
+                if date_to and date_to < date_from:
+                    App.logger.error(f'Date range of rollup command is empty: {args["<date_from>"]} is after {args["<date_to>"]}.')
+                    sys.exit(-1)
+                sys.exit(rollup(date_from, date_to, Path(args["--output"]) if args["--output"] else None, App))
+            if args["watch"]:
+                import asyncio
+                sys.exit(asyncio.run(watch(App)))
+            sys.exit(backfill(App) if args["--backfill"] else main(App))
     except DocoptExit as exc:
         App.logger.error(f'Not a valid usage pattern.\n{__doc__}')
+        sys.exit(-1)
+    except SystemExit:
+        raise
     except BaseException:   # do not use bare 'except' - pycodestyle(E722)
         App.logger.exception("Oops...", exc_info=True)
+        sys.exit(-1)
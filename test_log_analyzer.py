@@ -3,17 +3,33 @@
 """Unit tests for loag_analyzer.py"""
 
 import unittest
+from unittest import mock
+import gzip
+import lzma
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
 import pycodestyle
 import log_analyzer as la
 
 
+TEST_LOG_FILE_INFO = la.FileInfo(Path("tests/logs/log20200101"), datetime(2020, 1, 1), '')
+
+
+def init_app(**sections):
+    """Init App with tests/log_test.ini settings updated by [sections]."""
+    la.App.init("tests/log_test.ini")
+    la.App.configure(la.App.merge_config(sections, la.App.config))
+
+
 class TestCode(unittest.TestCase):
     """TestCode"""
 
     def test_conformance(self):
         """Test that we conform to PEP-8."""
         style = pycodestyle.StyleGuide(quiet=True, config_file='tox.ini')
-        result = style.check_files([la.__file__])
+        result = style.check_files([la.__file__, __file__])
         self.assertEqual(result.total_errors, 0,
                          "Found code style errors (and warnings).")
 
@@ -35,5 +51,562 @@ class TestMainCode(unittest.TestCase):
         self.assertTrue(la.main(la.App) >= 0, "Main functionality is failed.")
 
 
+class TestParseLog(unittest.TestCase):
+    """Test serial and parallel parsing of log"""
+
+    @staticmethod
+    def summary(stats):
+        return (stats.line_count, stats.mismatch_count, stats.samples(), stats.total_time,
+                dict((url, (times.count, times.total, times.max, times.values, times.buckets)) for url, times in stats.requests.items()))
+
+    def assertSameStats(self, stats, expected):
+        self.assertEqual(self.summary(stats), self.summary(expected))
+
+    def test_parallel_plain(self):
+        """Test parsing of plain log by byte ranges"""
+        init_app()
+        expected = la.parse_log(TEST_LOG_FILE_INFO)
+        self.assertEqual(expected.line_count, 1000)
+        init_app(Logs={'WORKERS': '2', 'CHUNK_SIZE': '4096'})
+        self.assertGreater(len(la.log_ranges(TEST_LOG_FILE_INFO, 4096)), 2)
+        self.assertSameStats(la.parse_log(TEST_LOG_FILE_INFO), expected)
+
+    def test_parallel_gz(self):
+        """Test parsing of gz log by decompressed segments"""
+        init_app()
+        expected = la.parse_log(TEST_LOG_FILE_INFO)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            gz_path = Path(tmp_dir, "log20200101.gz")
+            with open(TEST_LOG_FILE_INFO.path, 'rb') as log, gzip.open(gz_path, 'wb') as gz_log:
+                shutil.copyfileobj(log, gz_log)
+            init_app(Logs={'WORKERS': '2', 'CHUNK_SIZE': '4096'})
+            self.assertSameStats(la.parse_log(la.FileInfo(gz_path, TEST_LOG_FILE_INFO.cdt, 'gz')), expected)
+
+    @unittest.skipIf(la.zstandard is None, "zstandard is not installed")
+    def test_parallel_zst(self):
+        """Test parsing of zst log (zstandard reader has no readline) by decompressed segments"""
+        init_app()
+        expected = la.parse_log(TEST_LOG_FILE_INFO)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            zst_path = Path(tmp_dir, "log20200101.zst")
+            with open(TEST_LOG_FILE_INFO.path, 'rb') as log, la.zstandard.open(zst_path, 'wb') as zst_log:
+                shutil.copyfileobj(log, zst_log)
+            init_app(Logs={'WORKERS': '2', 'CHUNK_SIZE': '4096'})
+            self.assertSameStats(la.parse_log(la.FileInfo(zst_path, TEST_LOG_FILE_INFO.cdt, 'zst')), expected)
+
+    def test_compressed(self):
+        """Test reading of xz log and of gz log by external decompressor"""
+        init_app()
+        expected = la.parse_log(TEST_LOG_FILE_INFO)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for ext, module, decompressor in (('xz', lzma, None), ('gz', gzip, 'external')):
+                log_path = Path(tmp_dir, f"log20200101.{ext}")
+                with open(TEST_LOG_FILE_INFO.path, 'rb') as log, module.open(log_path, 'wb') as compressed_log:
+                    shutil.copyfileobj(log, compressed_log)
+                init_app(Logs={'DECOMPRESSOR': decompressor})
+                self.assertSameStats(la.parse_log(la.FileInfo(log_path, TEST_LOG_FILE_INFO.cdt, ext)), expected)
+
+
+class TestTimeStats(unittest.TestCase):
+    """Test bounded-memory time statistics"""
+
+    def test_exact(self):
+        """Test exact quantiles of small inputs"""
+        times = la.TimeStats(0.01, 100)
+        for time in (0.3, 0.1, 0.2, 0.4):
+            times.add(time)
+        self.assertEqual((times.count, times.max, times.quantile(0.5), times.quantile(1)), (4, 0.4, 0.25, 0.4))
+
+    def test_sketch(self):
+        """Test quantiles error bound and memory of sketch"""
+        times = la.TimeStats(0.01, 100)
+        values = [i / 1000 for i in range(1, 100001)]
+        for time in values:
+            times.add(time)
+        self.assertIsNone(times.values)
+        self.assertLess(len(times.buckets), 1000)
+        for q in (0.5, 0.9, 0.95, 0.99):
+            expected = values[round(q * (len(values) - 1))]
+            self.assertLessEqual(abs(times.quantile(q) - expected) / expected, 0.01 + 1e-9)
+
+
+class TestColumnarRequests(unittest.TestCase):
+    """Test columnar statistics engine"""
+
+    @unittest.skipIf(la.numpy_module() is None, "NumPy is not installed")
+    def test_same_as_stream(self):
+        """Test that columnar and stream (with exact quantiles) engines give the same summary"""
+        init_app(Stats={'ENGINE': 'columnar'})
+        stats = la.parse_log(TEST_LOG_FILE_INFO)
+        self.assertIsInstance(stats.requests, la.ColumnarRequests)
+        init_app(Stats={'QUANTILE_EXACT_LIMIT': '1000'})
+        expected = la.parse_log(TEST_LOG_FILE_INFO)
+        quantiles = [0.5, 0.9, 0.99]
+        for top in (None, 10):
+            for url_summary, expected_summary in zip(stats.requests.summary(quantiles, top), expected.requests.summary(quantiles, top), strict=True):
+                self.assertEqual(url_summary._replace(quantiles=tuple(round(q, 9) for q in url_summary.quantiles)),
+                                 expected_summary._replace(quantiles=tuple(round(q, 9) for q in expected_summary.quantiles)))
+
+
+class TestIncremental(unittest.TestCase):
+    """Test incremental parsing with checkpoints"""
+
+    def test_continue_and_rotate(self):
+        """Test that continued parsing gives the same report as parsing of the whole log, and rotated log is parsed again"""
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            content = log.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports')
+            logs_dir.mkdir()
+            init_app(Logs={'DIR': str(logs_dir), 'CHECKPOINT_INTERVAL': '10000'}, Report={'DIR': str(reports_dir)})
+            log_path, report_path = logs_dir / TEST_LOG_FILE_INFO.path.name, reports_dir / 'test-report-20200101.txt'
+            log_path.write_bytes(content)
+            self.assertEqual(la.main(la.App), 0)
+            expected = report_path.read_text()
+            report_path.unlink()
+
+            init_app(Logs={'DIR': str(logs_dir), 'CHECKPOINT_INTERVAL': '10000', 'INCREMENTAL': 'yes'}, Report={'DIR': str(reports_dir)})
+            log_path.write_bytes(content[:len(content) // 2])  # the last line is incomplete
+            self.assertEqual(la.main(la.App), 0)
+            checkpoint = la.load_checkpoint(la.checkpoint_file_path(report_path))
+            self.assertEqual(checkpoint['offset'], content.rfind(b'\n', 0, len(content) // 2) + 1)
+            with open(log_path, 'ab') as log:
+                log.write(content[len(content) // 2:])
+            self.assertEqual(la.main(la.App), 0)
+            self.assertEqual(report_path.read_text(), expected)
+
+            log_path.unlink()
+            log_path.write_bytes(content[:len(content) // 2])  # rotated: another inode and size
+            self.assertEqual(la.main(la.App), 0)
+            self.assertEqual(la.load_checkpoint(la.checkpoint_file_path(report_path))['stats']['line_count'], content.count(b'\n', 0, len(content) // 2))
+
+    def test_last_line_without_line_break(self):
+        """Test that the last line without line break of finished log is parsed in incremental mode as well"""
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            content = log.read().rstrip(b'\n')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports')
+            logs_dir.mkdir()
+            log_path, report_path = logs_dir / TEST_LOG_FILE_INFO.path.name, reports_dir / 'test-report-20200101.txt'
+            log_path.write_bytes(content)
+            init_app(Logs={'DIR': str(logs_dir)}, Report={'DIR': str(reports_dir)})
+            self.assertEqual(la.main(la.App), 0)
+            expected = report_path.read_text()
+            report_path.unlink()
+            init_app(Logs={'DIR': str(logs_dir), 'CHECKPOINT_INTERVAL': '10000', 'INCREMENTAL': 'yes'}, Report={'DIR': str(reports_dir)})
+            for _ in range(2):  # from the beginning and from checkpoint
+                self.assertEqual(la.main(la.App), 0)
+                self.assertEqual(report_path.read_text(), expected)
+            self.assertEqual(la.load_checkpoint(la.checkpoint_file_path(report_path))['offset'], content.rfind(b'\n') + 1)
+
+
+class TestBackfill(unittest.TestCase):
+    """Test backfill mode"""
+
+    def test_backfill(self):
+        """Test that reports are made for every log without report"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports')
+            logs_dir.mkdir()
+            reports_dir.mkdir()
+            for day in range(1, 5):
+                shutil.copyfile(TEST_LOG_FILE_INFO.path, logs_dir / f'log2020010{day}')
+            (reports_dir / 'test-report-20200102.txt').write_text('done')
+            init_app(Logs={'DIR': str(logs_dir), 'BACKFILL_WORKERS': '2'}, Report={'DIR': str(reports_dir)})
+            self.assertEqual(la.backfill(la.App), 0)
+            self.assertEqual(sorted(path.name for path in reports_dir.iterdir()), [f'test-report-2020010{day}.txt' for day in range(1, 5)])
+            self.assertEqual((reports_dir / 'test-report-20200102.txt').read_text(), 'done')
+            self.assertEqual(la.backfill(la.App), 2)
+
+    def test_metrics(self):
+        """Test that metrics of logs processed by workers are combined to one metrics file"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir, metrics_path = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports'), Path(tmp_dir, 'metrics.json')
+            logs_dir.mkdir()
+            for day in range(1, 5):
+                shutil.copyfile(TEST_LOG_FILE_INFO.path, logs_dir / f'log2020010{day}')
+            init_app(Logs={'DIR': str(logs_dir), 'BACKFILL_WORKERS': '4'}, Report={'DIR': str(reports_dir)}, Metrics={'FILE': str(metrics_path)})
+            self.assertEqual(la.backfill(la.App), 0)
+            metrics = la.json.loads(metrics_path.read_text())
+            self.assertEqual((metrics['stages']['parse']['calls'], metrics['totals']['lines']), (4, 4000))
+            self.assertEqual([path.name for path in Path(tmp_dir).iterdir() if path.is_file()], ['metrics.json'])
+
+
+class TestPartial(unittest.TestCase):
+    """Test partial statistics files and merge command"""
+
+    def test_roundtrip(self):
+        """Test that partial file keeps exact values, sketches and heavy hitter errors"""
+        init_app(Urls={'MAX_KEYS': '50'}, Stats={'QUANTILE_EXACT_LIMIT': '4'})
+        stats = la.parse_log(TEST_LOG_FILE_INFO)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            partial_path = Path(tmp_dir, 'test.partial')
+            la.write_partial(partial_path, stats, {'date': '2020-01-01T00:00:00'})
+            loaded, header = la.read_partial(partial_path)
+        self.assertEqual(header['date'], '2020-01-01T00:00:00')
+        self.assertEqual(TestParseLog.summary(loaded), TestParseLog.summary(stats))
+        self.assertEqual((loaded.line_count, loaded.mismatch_count, loaded.requests.floor, loaded.requests.errors),
+                         (stats.line_count, stats.mismatch_count, stats.requests.floor, stats.requests.errors))
+
+    def test_merge(self):
+        """Test that merged report of partials of split log is the same as report of the whole log"""
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            lines = log.readlines()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reports_dir = Path(tmp_dir, 'reports')
+            reports_dir.mkdir()
+            partial_paths = []
+            for host, host_lines in enumerate((lines[:400], lines[400:])):
+                logs_dir = Path(tmp_dir, f'logs{host}')
+                logs_dir.mkdir()
+                (logs_dir / TEST_LOG_FILE_INFO.path.name).write_bytes(b''.join(host_lines))
+                init_app(Logs={'DIR': str(logs_dir)}, Report={'DIR': str(reports_dir), 'PARTIAL': 'yes'})
+                self.assertEqual(la.main(la.App), 0)
+                partial_paths.append(la.partial_file_path(reports_dir / 'test-report-20200101.txt').rename(reports_dir / f'host{host}.partial'))
+            self.assertEqual(la.merge_partials(partial_paths, app=la.App), 0)
+            merged = (reports_dir / 'test-report-20200101.txt').read_text()
+            init_app(Report={'DIR': str(reports_dir)})
+            self.assertEqual(la.merge_partials(partial_paths[:1], reports_dir / 'first.txt', la.App), 0)
+            self.assertEqual(la.merge_partials([partial_paths[0], TEST_LOG_FILE_INFO.path], reports_dir / 'first.txt', la.App), -1)
+            for stats_cfg in ({'QUANTILE_RELATIVE_ERROR': '0.02'}, {'DIMENSIONS': 'status'}):  # partials of other settings aren't merged
+                init_app(Report={'DIR': str(reports_dir)}, Stats=stats_cfg)
+                la.write_partial(reports_dir / 'other.partial', la.parse_log(TEST_LOG_FILE_INFO), {'date': '2020-01-01T00:00:00'})
+                init_app(Report={'DIR': str(reports_dir)})
+                self.assertEqual(la.merge_partials([partial_paths[0], reports_dir / 'other.partial'], reports_dir / 'first.txt', la.App), -1)
+            self.assertEqual(la.main(la.App), 2)
+            (reports_dir / 'test-report-20200101.txt').unlink()
+            self.assertEqual(la.main(la.App), 0)
+            self.assertEqual((reports_dir / 'test-report-20200101.txt').read_text(), merged)
+
+
+class TestMismatch(unittest.TestCase):
+    """Test bounded mismatch samples, format validation and early abort"""
+
+    def test_samples(self):
+        """Test that samples of mismatched lines are bounded and the same for serial and parallel parsing"""
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            lines = log.readlines()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_path = Path(tmp_dir, 'log20200101')
+            log_path.write_bytes(b''.join(f'bad line {i}\n'.encode() if i % 10 == 0 else line for i, line in enumerate(lines)))
+            log_file_info = la.FileInfo(log_path, TEST_LOG_FILE_INFO.cdt, '')
+            init_app(Logs={'MISMATCH_SAMPLES': '5'})
+            expected = la.parse_log(log_file_info)
+            self.assertEqual((expected.mismatch_count, len(expected.samples())), (100, 5))
+            self.assertTrue(all(line == f'bad line {line_number}' for line_number, line in expected.samples()))
+            init_app(Logs={'MISMATCH_SAMPLES': '5', 'WORKERS': '2', 'CHUNK_SIZE': '4096'})
+            self.assertEqual(TestParseLog.summary(la.parse_log(log_file_info)), TestParseLog.summary(expected))
+
+    def test_abort(self):
+        """Test that log of wrong format is rejected by sampled lines, and parsing is aborted as soon as mismatch limit is exceeded"""
+        init_app(Logs={'UNMATCHED_LINE_LIMIT': '0.1'})
+        lines = iter([b'bad line'] * 10000)
+        with self.assertRaises(la.MismatchLimitError):
+            la.parse_lines(lines, la.App.cfg, mismatch_budget=100)
+        self.assertEqual(len(list(lines)), 10000 - 101)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports')
+            logs_dir.mkdir()
+            (logs_dir / 'log20200101').write_bytes(b'bad line\n' * 100000)
+            for sample_size, stages in (('200', ['scan', 'validate']), ('0', ['scan', 'parse'])):
+                init_app(Logs={'DIR': str(logs_dir), 'UNMATCHED_LINE_LIMIT': '0.1', 'VALIDATION_SAMPLE_SIZE': sample_size}, Report={'DIR': str(reports_dir)})
+                self.assertEqual(la.main(la.App), -1)
+                self.assertEqual(list(la.App.metrics.stages), stages)
+            self.assertEqual(len(la.sample_log_lines(la.FileInfo(logs_dir / 'log20200101', TEST_LOG_FILE_INFO.cdt, ''), 200)), 200)
+
+    def test_bursts(self):
+        """Test that local bursts of broken lines (at the beginning or in the middle of log) don't abort parsing of log within mismatch limit"""
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            lines = log.readlines() * 10
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports')
+            logs_dir.mkdir()
+            reports_dir.mkdir()
+            logs = {'log20200101': b'bad line\n' * 40 + b''.join(lines),
+                    'log20200102': b''.join(lines[:1000]) + b'bad line\n' * 200 + b''.join(lines[1000:]),
+                    'log20200103.gz': gzip.compress(b'bad line\n' * 40 + b''.join(lines))}
+            for name, content in logs.items():
+                (logs_dir / name).write_bytes(content)
+            init_app()
+            mismatch_count = la.parse_log(TEST_LOG_FILE_INFO).mismatch_count * 10
+            for workers in ('1', '2'):
+                init_app(Logs={'DIR': str(logs_dir), 'UNMATCHED_LINE_LIMIT': '0.1', 'WORKERS': workers, 'CHUNK_SIZE': '65536'}, Report={'DIR': str(reports_dir)})
+                for name in logs:
+                    log_file_info = la.FileInfo(logs_dir / name, TEST_LOG_FILE_INFO.cdt, name.partition('.')[2])
+                    self.assertEqual(la.process_log(log_file_info, Path(reports_dir, f'{name}.txt')), 0)
+                    self.assertEqual(la.parse_log(log_file_info).mismatch_count, mismatch_count + (200 if name == 'log20200102' else 40))
+
+
+class TestMetrics(unittest.TestCase):
+    """Test stage instrumentation and metrics export"""
+
+    def test_metrics_file(self):
+        """Test that metrics of stages and totals are saved in JSON and Prometheus formats"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for metrics_name in ('metrics.json', 'metrics.prom'):
+                metrics_path = Path(tmp_dir, metrics_name)
+                init_app(Report={'DIR': str(Path(tmp_dir, metrics_name + '.reports'))}, Metrics={'FILE': str(metrics_path), 'DETAILED': 'yes'})
+                self.assertEqual(la.main(la.App), 0)
+            metrics = la.json.loads(Path(tmp_dir, 'metrics.json').read_text())
+            self.assertEqual(metrics['totals'], {'lines': 1000, 'mismatches': 0})
+            self.assertEqual(list(metrics['stages']), ['scan', 'parse', 'read', 'match', 'stats', 'summary', 'write'])
+            self.assertEqual((metrics['stages']['parse']['items'], metrics['stages']['match']['calls']), (1000, 1000))
+            self.assertEqual(metrics['stages']['parse']['bytes'], TEST_LOG_FILE_INFO.path.stat().st_size)
+            self.assertIn('log_analyzer_stage_items{stage="parse"} 1000\n', Path(tmp_dir, 'metrics.prom').read_text())
+
+
+class TestReport(unittest.TestCase):
+    """Test report formats and compression"""
+
+    def test_formats(self):
+        """Test that compressed template report is the same as plain one and csv, jsonl reports have the same rows"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            init_app(Report={'DIR': str(Path(tmp_dir, 'plain'))})
+            self.assertEqual(la.main(la.App), 0)
+            init_app(Report={'DIR': str(Path(tmp_dir, 'gz')), 'FORMATS': 'template, csv, jsonl', 'COMPRESS': 'yes'})
+            self.assertEqual(la.main(la.App), 0)
+            report = Path(tmp_dir, 'plain', 'test-report-20200101.txt').read_text()
+            with la.gzip.open(Path(tmp_dir, 'gz', 'test-report-20200101.txt.gz'), 'rt') as report_file:
+                self.assertEqual(report_file.read(), report)
+            with la.gzip.open(Path(tmp_dir, 'gz', 'test-report-20200101.csv.gz'), 'rt', newline='') as report_file:
+                csv_rows = list(la.csv.DictReader(report_file))
+            with la.gzip.open(Path(tmp_dir, 'gz', 'test-report-20200101.jsonl.gz'), 'rt') as report_file:
+                json_rows = [la.json.loads(line) for line in report_file]
+            self.assertEqual(len(csv_rows), len(json_rows))
+            self.assertEqual([row['url'] for row in csv_rows], [row['url'] for row in json_rows])
+            self.assertEqual(float(csv_rows[0]['time_sum']), json_rows[0]['time_sum'])
+            self.assertIn(la.json.dumps(json_rows[0]), report)
+
+
+class TestDimensions(unittest.TestCase):
+    """Test statistics by status, method and time buckets calculated in the same pass"""
+
+    @staticmethod
+    def dimensions(stats):
+        return dict((dimension, dict((key, (times.count, times.total, times.max)) for key, times in requests.items()))
+                    for dimension, requests in stats.dimensions.items())
+
+    def test_dimensions(self):
+        """Test that dimensions don't depend on parser and parallel parsing, keys cover all matched requests"""
+        init_app()
+        expected = la.parse_log(TEST_LOG_FILE_INFO)
+        init_app(Stats={'DIMENSIONS': 'status, status_class, method, 1m, hour'})
+        stats = la.parse_log(TEST_LOG_FILE_INFO)
+        self.assertEqual(TestParseLog.summary(stats), TestParseLog.summary(expected))
+        dimensions = self.dimensions(stats)
+        self.assertEqual((dimensions['status']['404'][0], dimensions['status_class']['4xx'][0], list(dimensions['hour'])), (69, 72, ['2017-06-29 03:00']))
+        for keys in dimensions.values():
+            self.assertEqual(sum(count for count, _, _ in keys.values()), stats.line_count - stats.mismatch_count)
+            self.assertAlmostEqual(sum(total for _, total, _ in keys.values()), stats.total_time)
+        for overrides in ({'LOG_FORMAT': ''}, {'WORKERS': '2', 'CHUNK_SIZE': '4096'}):
+            init_app(Logs=overrides, Stats={'DIMENSIONS': 'status, status_class, method, 1m, hour'})
+            self.assertEqual(self.dimensions(la.parse_log(TEST_LOG_FILE_INFO)), dimensions)
+
+    def test_partial_and_report(self):
+        """Test that dimensions are kept in partial file and saved to report files"""
+        init_app(Report={'FORMATS': 'template, csv'}, Stats={'DIMENSIONS': 'status, 15m'})
+        stats = la.parse_log(TEST_LOG_FILE_INFO)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            partial_path = Path(tmp_dir, 'test.partial')
+            la.write_partial(partial_path, stats, {})
+            self.assertEqual(self.dimensions(la.read_partial(partial_path)[0]), self.dimensions(stats))
+            la.save_report(stats, Path(tmp_dir, 'report.txt'))
+            with open(Path(tmp_dir, 'report.status.csv'), newline='') as report_file:
+                rows = list(la.csv.DictReader(report_file))
+            self.assertEqual((rows[0]['status'], rows[0]['count']), ('200', '925'))
+            self.assertFalse(Path(tmp_dir, 'report.status.txt').exists())
+
+
+class TestWatch(unittest.TestCase):
+    """Test watch mode"""
+
+    def test_poll(self):
+        """Test that polls of growing log give the same report as parsing of the whole log, report and metrics are served by HTTP"""
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            content = log.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports')
+            logs_dir.mkdir()
+            init_app(Logs={'DIR': str(logs_dir)}, Report={'DIR': str(reports_dir)})
+            log_path, report_path = logs_dir / TEST_LOG_FILE_INFO.path.name, reports_dir / 'test-report-20200101.txt'
+            log_path.write_bytes(content)
+            self.assertEqual(la.main(la.App), 0)
+            expected = report_path.read_text()
+            report_path.unlink()
+
+            log_path.write_bytes(content[:len(content) // 2])  # the last line is incomplete
+            watcher = la.Watcher(la.App)
+            self.assertTrue(watcher.poll())
+            self.assertEqual(watcher.offset, content.rfind(b'\n', 0, len(content) // 2) + 1)
+            with open(log_path, 'ab') as log:
+                log.write(content[len(content) // 2:])
+            self.assertTrue(watcher.poll())
+            self.assertFalse(watcher.poll())
+            self.assertEqual(report_path.read_text(), expected)
+            self.assertEqual(watcher.response('/'), (200, {'Content-Type': 'text/plain; charset=utf-8'}, expected.encode()))
+            status, _, body = watcher.response('/metrics.json')
+            self.assertEqual((status, la.json.loads(body)['watch']['lines']), (200, content.count(b'\n')))
+            self.assertEqual(watcher.response('/unknown')[0], 404)
+
+    def test_switch(self):
+        """Test that the rest of log (new lines and the last line without line break) is parsed before log of a newer date is watched"""
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            content = log.read().rstrip(b'\n')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports')
+            logs_dir.mkdir()
+            log_path, report_path = logs_dir / TEST_LOG_FILE_INFO.path.name, reports_dir / 'test-report-20200101.txt'
+            log_path.write_bytes(content)
+            init_app(Logs={'DIR': str(logs_dir)}, Report={'DIR': str(reports_dir)})
+            self.assertEqual(la.main(la.App), 0)
+            expected = report_path.read_text()
+            report_path.unlink()
+
+            log_path.write_bytes(content[:len(content) // 2])
+            watcher = la.Watcher(la.App)
+            self.assertTrue(watcher.poll())
+            with open(log_path, 'ab') as log:
+                log.write(content[len(content) // 2:])
+            shutil.copyfile(TEST_LOG_FILE_INFO.path, logs_dir / 'log20200102')
+            self.assertTrue(watcher.poll())
+            self.assertEqual(report_path.read_text(), expected)
+            self.assertEqual(watcher.log_file_info.path.name, 'log20200102')
+
+
+class TestRollup(unittest.TestCase):
+    """Test rollup reports made of cached statistics of days"""
+
+    def test_rollup(self):
+        """Test that rollup gives the same report as merged statistics of logs of range, and only logs without fresh cache are parsed"""
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            content = log.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports')
+            logs_dir.mkdir()
+            init_app()
+            la.save_report(la.parse_log(TEST_LOG_FILE_INFO).merge(la.parse_log(TEST_LOG_FILE_INFO)).merge(la.parse_log(TEST_LOG_FILE_INFO)), Path(tmp_dir, 'expected.txt'))
+            expected = Path(tmp_dir, 'expected.txt').read_text()
+
+            for day in range(1, 5):
+                shutil.copyfile(TEST_LOG_FILE_INFO.path, logs_dir / f'log2020010{day}')
+            init_app(Logs={'DIR': str(logs_dir), 'BACKFILL_WORKERS': '2'}, Report={'DIR': str(reports_dir), 'CACHE': 'yes'})
+            self.assertEqual(la.main(la.App), 0)  # the latest log is cached by daily run
+            cache_dir, report_path = reports_dir / 'cache', reports_dir / 'test-report-20200101-20200103.txt'
+            self.assertEqual(sorted(path.name for path in cache_dir.iterdir()), ['test-report-20200104.partial'])
+            self.assertEqual(la.rollup(datetime(2020, 1, 1), datetime(2020, 1, 3), None, la.App), 0)
+            self.assertEqual(report_path.read_text(), expected)
+            self.assertEqual(len(list(cache_dir.iterdir())), 4)
+
+            mtimes = dict((path.name, path.stat().st_mtime_ns) for path in cache_dir.iterdir())
+            with open(logs_dir / 'log20200102', 'ab') as log:
+                log.write(content[:content.index(b'\n') + 1])
+            (logs_dir / 'log20200103').unlink()  # removed log is taken from cache
+            self.assertEqual(la.rollup(datetime(2020, 1, 1), datetime(2020, 1, 3), None, la.App), 0)
+            self.assertEqual([name for name, mtime in mtimes.items() if (cache_dir / name).stat().st_mtime_ns != mtime], ['test-report-20200102.partial'])
+            self.assertEqual(la.read_partial(cache_dir / 'test-report-20200102.partial')[0].line_count, content.count(b'\n') + 1)
+
+            init_app(Logs={'DIR': str(logs_dir)}, Report={'DIR': str(reports_dir)}, Stats={'DIMENSIONS': 'status'})
+            self.assertEqual(la.rollup(datetime(2020, 1, 1), None, reports_dir / 'all.txt', la.App), 0)  # other settings: all logs are parsed again
+            self.assertEqual(la.read_partial(cache_dir / 'test-report-20200101.partial')[1]['settings']['DIMENSIONS'], 'status')
+            self.assertEqual(la.rollup(datetime(2021, 1, 1), None, None, la.App), 1)
+
+    def test_incremental_cache(self):
+        """Test that statistics cached of growing log (by incremental run too) have the parsed size, so they are stale when the log has grown"""
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            content = log.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            logs_dir, reports_dir = Path(tmp_dir, 'logs'), Path(tmp_dir, 'reports')
+            logs_dir.mkdir()
+            log_path = logs_dir / TEST_LOG_FILE_INFO.path.name
+            log_path.write_bytes(content)
+            init_app(Logs={'DIR': str(logs_dir)}, Report={'DIR': str(reports_dir)})
+            self.assertEqual(la.rollup(datetime(2020, 1, 1), None, reports_dir / 'expected.txt', la.App), 0)
+            expected = (reports_dir / 'expected.txt').read_text()
+            shutil.rmtree(reports_dir)
+
+            log_path.write_bytes(content[:len(content) // 2])  # the last line is incomplete
+            init_app(Logs={'DIR': str(logs_dir), 'INCREMENTAL': 'yes'}, Report={'DIR': str(reports_dir), 'CACHE': 'yes'})
+            self.assertEqual(la.main(la.App), 0)
+            header = la.read_partial_header(reports_dir / 'cache' / 'test-report-20200101.partial')
+            self.assertEqual((header['size'], header['line_count']), (len(content) // 2, content.count(b'\n', 0, len(content) // 2) + 1))
+            with open(log_path, 'ab') as log:
+                log.write(content[len(content) // 2:])
+            self.assertEqual(la.rollup(datetime(2020, 1, 1), None, reports_dir / 'rollup.txt', la.App), 0)
+            self.assertEqual((reports_dir / 'rollup.txt').read_text(), expected)
+
+            log_fingerprint = la.log_fingerprint
+
+            def growing_log_fingerprint(log_file_info):  # log grows after its fingerprint has been taken
+                fingerprint = log_fingerprint(log_file_info)
+                with open(log_path, 'ab') as log:
+                    log.write(content[:content.index(b'\n') + 1])
+                return fingerprint
+            with mock.patch.object(la, 'log_fingerprint', growing_log_fingerprint):
+                self.assertEqual(la.cache_log(la.FileInfo(log_path, datetime(2020, 1, 1), ''), la.App), 0)
+            header = la.read_partial_header(reports_dir / 'cache' / 'test-report-20200101.partial')
+            self.assertEqual((header['size'], header['line_count']), (len(content), content.count(b'\n')))
+
+
+class TestUrls(unittest.TestCase):
+    """Test url templating and heavy hitters"""
+
+    def test_normalize(self):
+        """Test that ids in urls are collapsed to templates"""
+        init_app(Urls={'NORMALIZE': 'yes'})
+        stats = la.parse_log(TEST_LOG_FILE_INFO)
+        self.assertIn('/api/v2/banner/{id}', stats.requests)
+        self.assertFalse(any(la.re.search(r'/\d+(/|$)', url) for url in stats.requests))
+
+    def test_max_keys(self):
+        """Test that number of urls is bounded and top urls by total time are kept"""
+        self.assertRaises(ValueError, la.App.init, "tests/log_test.ini", {'Urls': {'MAX_KEYS': '50'}})  # less than Report.REPORT_SIZE
+        init_app()
+        expected = dict((url, times.total) for url, times in la.parse_log(TEST_LOG_FILE_INFO).requests.items())
+        init_app(Urls={'MAX_KEYS': '50'})
+        requests = la.parse_log(TEST_LOG_FILE_INFO).requests
+        self.assertLess(len(requests), 100)
+        self.assertEqual([url_summary.url for url_summary in requests.summary([0.5], 5)], sorted(expected, key=expected.get, reverse=True)[:5])
+        for url, times in requests.items():
+            self.assertLessEqual(times.total, expected[url] + 1e-9)
+            self.assertGreaterEqual(requests.estimate(url), expected[url] - 1e-9)
+
+
+class TestLineParser(unittest.TestCase):
+    """Test fast line parser"""
+
+    def test_same_as_regex(self):
+        """Test that fast path and regex give the same results"""
+        log_cfg = la.App.cfg.Logs
+        parser, regex = la.LineParser(log_cfg.LINE_FORMAT, log_cfg.LOG_FORMAT), la.re.compile(log_cfg.LINE_FORMAT, la.re.IGNORECASE)
+        line = b'1.2.3.4 -  - [29/Jun/2017:03:50:22 +0300] "GET /api/v2/banner/1 HTTP/1.1" 200 927 "-" "Lynx" "-" "1-2" "-" 0.390'
+        lines = [line, line.replace(b' 200 ', b' 20 '), line.replace(b'"-" "Lynx"', b'"a b" "Lynx"'), line.replace(b'"-" "Lynx"', b'"-""Lynx"'),
+                 line.replace(b'/1 ', b'/%31 '), line.replace(b'/1 ', b'/1?q=%31 '), line.replace(b'Lynx', 'Люкс'.encode()), line.replace(b'GET ', b'GET\t'),
+                 line.replace(b'0.390', b'-'), line.replace(b'0.390', b'0.3.9'), line.replace(b'Lynx', b'Ly"nx'), line.replace(b'1.2.3.4', b'localhost')]
+        with open(TEST_LOG_FILE_INFO.path, 'rb') as log:
+            lines.extend(line.rstrip(b'\n') for line in log)
+        fast_count = 0
+        for line in lines:
+            expected = la.get_request_info(line.decode(), regex)
+            if request_info := parser.fast_request_info(line):
+                fast_count += 1
+                self.assertEqual(request_info, expected, line)
+            self.assertEqual(parser(line), expected, line)
+        self.assertGreater(fast_count, 1000)
+
+    def test_custom_line_format(self):
+        """Test that lines are parsed by custom LINE_FORMAT unless LOG_FORMAT is set in config too"""
+        init_app()
+        log_format, line_format = la.App.cfg.Logs.LOG_FORMAT, r'"\S+ (?P<request_url>\S+) [^"]*".* (?P<request_time>[\d.]+)$'
+        line = b'1.2.3.4 -  - [29/Jun/2017:03:50:22 +0300] "GET /API/v2/Banner/1?a=1 HTTP/1.1" 200 927 "-" "Lynx" "-" "1-2" "-" 0.390'
+        self.addCleanup(init_app)
+        with mock.patch.object(la.App.logger, 'warning') as warning:  # logging is set up again by init, so assertLogs handler would be removed
+            la.App.init("tests/log_test.ini", {'Logs': {'LINE_FORMAT': line_format}})
+        warning.assert_called_once()
+        self.assertIsNone(la.App.cfg.Logs.LOG_FORMAT)
+        self.assertEqual(la.LineParser.from_cfg(la.App.cfg.Logs)(line)[:2], ('/api/v2/banner/1?a=1', 0.39))
+        la.App.init("tests/log_test.ini", {'Logs': {'LINE_FORMAT': line_format, 'LOG_FORMAT': log_format}})
+        self.assertEqual(la.LineParser.from_cfg(la.App.cfg.Logs)(line)[:2], ('/api/v2/banner/1', 0.39))
+
+
 if __name__ == '__main__':
     unittest.main()